@@ -5,28 +5,70 @@ Asks user about occasion, formality, dress code, and preferences for each outfit
 """
 
 import os
-import json
+import time
+import bisect
+import asyncio
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, Optional, List
 
+from json_utils import load_json, save_json
+
+try:
+    import aiohttp
+    HAS_AIOHTTP = True
+except ImportError:
+    HAS_AIOHTTP = False
+
+# Weather responses are reused across runs for this many seconds
+WEATHER_CACHE_TTL = 600
+DEFAULT_WEATHER_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "outfit_weather.json")
+
+# Formality menu choices (ask_daily_context)
+FORMALITY_MAP = {
+    '1': {'level': 'formal', 'name': '非常正式'},
+    '2': {'level': 'business_formal', 'name': '商務正式'},
+    '3': {'level': 'business_casual', 'name': '商務休閒'},
+    '4': {'level': 'casual', 'name': '休閒'},
+    '5': {'level': 'sporty', 'name': '運動休閒'}
+}
+
+# Comfort buckets by adjusted temperature: COMFORT_TABLE[i] applies below COMFORT_BOUNDS[i]
+COMFORT_BOUNDS = (10, 18, 25, 30)
+COMFORT_TABLE = (
+    ("cold", "heavy", ("需要厚外套或大衣", "建議多層穿搭", "可考慮圍巾、手套等配件", "選擇保暖材質如羊毛、羽絨")),
+    ("cool", "medium", ("需要外套", "建議薄毛衣或長袖襯衫", "可穿長褲", "洋蔥式穿搭方便調節")),
+    ("comfortable", "light", ("輕薄外套即可", "可穿長袖或短袖", "舒適溫度範圍", "注意室內外溫差")),
+    ("warm", "minimal", ("穿短袖或無袖", "選擇透氣材質如棉、麻", "避免厚重衣物", "淺色衣物較不吸熱")),
+    ("hot", "minimal", ("穿著清涼衣物", "選擇吸汗透氣材質", "避免深色和厚重衣物", "注意防曬")),
+)
+
 
 class ContextCollectorAgent:
     """
     Agent responsible for collecting contextual information through interactive prompts.
     """
     
-    def __init__(self, user_profile: Optional[Dict] = None, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        user_profile: Optional[Dict] = None,
+        api_key: Optional[str] = None,
+        weather_cache_path: Optional[str] = DEFAULT_WEATHER_CACHE_PATH
+    ):
         """
         Initialize the Context Collector Agent.
         
         Args:
             user_profile: User profile dictionary
             api_key: WeatherAPI key for weather data
+            weather_cache_path: JSON file caching weather responses (None disables caching)
         """
         self.user_profile = user_profile or {}
         self.api_key = api_key or "API_KEY_HERE"  # API key (free trial smpe 24 dec)
         self.weather_base_url = "https://api.weatherapi.com/v1/current.json" 
+        self.weather_cache_path = weather_cache_path
+        self._weather_cache = None
 
     def get_weather_data(self, city: Optional[str] = None, country_code: Optional[str] = None) -> Dict:
         """
@@ -49,6 +91,10 @@ class ContextCollectorAgent:
             print("⚠️  未提供天氣 API 密鑰，使用模擬資料")
             return self._get_mock_weather_data(city)
         
+        cached = self._get_cached_weather(city)
+        if cached is not None:
+            return cached
+        
         try:
             params = {
                 'key': self.api_key,  # WeatherAPI requires 'key' for the API key
@@ -59,18 +105,8 @@ class ContextCollectorAgent:
             response = requests.get(self.weather_base_url, params=params, timeout=10)
             response.raise_for_status()
             
-            data = response.json()
-            
-            weather_info = {
-                'temperature': data['current']['temp_c'],  # Temperature in Celsius
-                'feels_like': data['current']['feelslike_c'],  # Feels-like temperature
-                'humidity': data['current']['humidity'],  # Humidity percentage
-                'weather_condition': data['current']['condition']['text'],  # Weather condition text
-                'wind_speed': data['current']['wind_kph'],  # Wind speed in kph
-                'city': city,
-                'timestamp': datetime.now().isoformat()
-            }
-            
+            weather_info = self._parse_weather_response(response.json(), city)
+            self._store_cached_weather(city, weather_info)
             return weather_info
             
         except requests.exceptions.RequestException as e:
@@ -78,6 +114,136 @@ class ContextCollectorAgent:
             print("使用模擬天氣資料")
             return self._get_mock_weather_data(city)
     
+    async def get_weather_data_async(self, city: Optional[str] = None) -> Dict:
+        """
+        Non-blocking variant of get_weather_data for concurrent fetches.
+        Falls back to the blocking client in a worker thread if aiohttp is not installed.
+        
+        Args:
+            city: City name (uses profile if None)
+            
+        Returns:
+            Dictionary containing weather information
+        """
+        if city is None:
+            city = self.user_profile.get('location', {}).get('city', 'Taipei')
+        
+        if not HAS_AIOHTTP:
+            return await asyncio.to_thread(self.get_weather_data, city)
+        
+        if not self.api_key:
+            print("⚠️  未提供天氣 API 密鑰，使用模擬資料")
+            return self._get_mock_weather_data(city)
+        
+        cached = self._get_cached_weather(city)
+        if cached is not None:
+            return cached
+        
+        params = {'key': self.api_key, 'q': city, 'aqi': 'no'}
+        try:
+            timeout = aiohttp.ClientTimeout(total=10)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.get(self.weather_base_url, params=params) as response:
+                    response.raise_for_status()
+                    data = await response.json()
+            weather_info = self._parse_weather_response(data, city)
+            self._store_cached_weather(city, weather_info)
+            return weather_info
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"⚠️  獲取天氣資料時發生錯誤: {e}")
+            print("使用模擬天氣資料")
+            return self._get_mock_weather_data(city)
+    
+    def get_weather_for_cities(self, cities: List[str]) -> Dict[str, Dict]:
+        """
+        Fetch weather for several cities concurrently.
+        
+        Args:
+            cities: List of city names
+            
+        Returns:
+            Dictionary mapping city name to weather information
+        """
+        async def _gather():
+            return await asyncio.gather(*[self.get_weather_data_async(c) for c in cities])
+        
+        return dict(zip(cities, asyncio.run(_gather())))
+    
+    def _weather_cache_key(self, city: str) -> str:
+        """Cache key for a city within the current TTL bucket."""
+        return f"{city.lower()}:{int(time.time() // WEATHER_CACHE_TTL)}"
+    
+    def _load_weather_cache(self) -> Dict:
+        """Load the on-disk weather cache once per agent."""
+        if self._weather_cache is None:
+            self._weather_cache = {}
+            if self.weather_cache_path and os.path.exists(self.weather_cache_path):
+                try:
+                    self._weather_cache = load_json(self.weather_cache_path)
+                except (OSError, ValueError):
+                    pass
+        return self._weather_cache
+    
+    def _get_cached_weather(self, city: str) -> Optional[Dict]:
+        """
+        Return cached weather for the city if fetched within the current TTL bucket.
+        
+        Args:
+            city: City name
+            
+        Returns:
+            Cached weather dictionary or None on miss
+        """
+        if not self.weather_cache_path:
+            return None
+        return self._load_weather_cache().get(self._weather_cache_key(city))
+    
+    def _store_cached_weather(self, city: str, weather_info: Dict):
+        """
+        Store weather in the cache, drop expired buckets, and write the file atomically.
+        
+        Args:
+            city: City name
+            weather_info: Weather dictionary to cache
+        """
+        if not self.weather_cache_path:
+            return
+        
+        cache = self._load_weather_cache()
+        current_bucket = self._weather_cache_key(city).rsplit(':', 1)[1]
+        for key in [k for k in cache if k.rsplit(':', 1)[1] != current_bucket]:
+            del cache[key]
+        cache[self._weather_cache_key(city)] = weather_info
+        
+        try:
+            os.makedirs(os.path.dirname(self.weather_cache_path) or '.', exist_ok=True)
+            tmp_path = f"{self.weather_cache_path}.tmp"
+            save_json(cache, tmp_path, indent=False)
+            os.replace(tmp_path, self.weather_cache_path)
+        except OSError as e:
+            print(f"⚠️  無法寫入天氣快取: {e}")
+    
+    def _parse_weather_response(self, data: Dict, city: str) -> Dict:
+        """
+        Convert a WeatherAPI current.json payload into the weather info dictionary.
+        
+        Args:
+            data: Parsed WeatherAPI response
+            city: City name the data was requested for
+            
+        Returns:
+            Dictionary containing weather information
+        """
+        return {
+            'temperature': data['current']['temp_c'],  # Temperature in Celsius
+            'feels_like': data['current']['feelslike_c'],  # Feels-like temperature
+            'humidity': data['current']['humidity'],  # Humidity percentage
+            'weather_condition': data['current']['condition']['text'],  # Weather condition text
+            'wind_speed': data['current']['wind_kph'],  # Wind speed in kph
+            'city': city,
+            'timestamp': datetime.now().isoformat()
+        }
+    
     def _get_mock_weather_data(self, city: str = "Taipei") -> Dict: # mock data if the API key is not avail
         """
         Generate mock weather data for testing without API key.
@@ -136,15 +302,7 @@ class ContextCollectorAgent:
         print("  5. 運動休閒 (Sporty/Athleisure) - 運動風格")
         
         formality_choice = input("\n選擇正式程度 (1-5): ").strip()
-        formality_map = {
-            '1': {'level': 'formal', 'name': '非常正式'},
-            '2': {'level': 'business_formal', 'name': '商務正式'},
-            '3': {'level': 'business_casual', 'name': '商務休閒'},
-            '4': {'level': 'casual', 'name': '休閒'},
-            '5': {'level': 'sporty', 'name': '運動休閒'}
-        }
-        
-        formality_info = formality_map.get(formality_choice, formality_map['4'])
+        formality_info = FORMALITY_MAP.get(formality_choice, FORMALITY_MAP['4'])
         context['formality'] = formality_info['level']
         context['formality_name'] = formality_info['name']
         
@@ -245,31 +403,13 @@ class ContextCollectorAgent:
         elif temp_sensitivity in ['怕熱', 'heat-sensitive']:
             adjusted_temp += 3  # Treat as 3 degrees warmer
         
-        if adjusted_temp < 10:
-            comfort_level = "cold"
-            layers_needed = "heavy"
-            recommendations = ["需要厚外套或大衣", "建議多層穿搭", "可考慮圍巾、手套等配件", "選擇保暖材質如羊毛、羽絨"]
-        elif adjusted_temp < 18:
-            comfort_level = "cool"
-            layers_needed = "medium"
-            recommendations = ["需要外套", "建議薄毛衣或長袖襯衫", "可穿長褲", "洋蔥式穿搭方便調節"]
-        elif adjusted_temp < 25:
-            comfort_level = "comfortable"
-            layers_needed = "light"
-            recommendations = ["輕薄外套即可", "可穿長袖或短袖", "舒適溫度範圍", "注意室內外溫差"]
-        elif adjusted_temp < 30:
-            comfort_level = "warm"
-            layers_needed = "minimal"
-            recommendations = ["穿短袖或無袖", "選擇透氣材質如棉、麻", "避免厚重衣物", "淺色衣物較不吸熱"]
-        else:
-            comfort_level = "hot"
-            layers_needed = "minimal"
-            recommendations = ["穿著清涼衣物", "選擇吸汗透氣材質", "避免深色和厚重衣物", "注意防曬"]
+        bucket = bisect.bisect_right(COMFORT_BOUNDS, adjusted_temp)
+        comfort_level, layers_needed, recommendations = COMFORT_TABLE[bucket]
         
         return {
             'comfort_level': comfort_level,
             'layers_needed': layers_needed,
-            'recommendations': recommendations,
+            'recommendations': list(recommendations),
             'temperature': temperature,
             'adjusted_temperature': adjusted_temp,
             'user_sensitivity': temp_sensitivity
@@ -285,9 +425,11 @@ class ContextCollectorAgent:
         Returns:
             Complete context dictionary
         """
-        # Get weather data
+        # Fetch weather in the background so the network round trip overlaps with the questions
         print("\n🌤️  正在獲取天氣資料...")
-        weather = self.get_weather_data()
+        executor = ThreadPoolExecutor(max_workers=1)
+        weather_future = executor.submit(self.get_weather_data)
+        executor.shutdown(wait=False)
         
         # Ask daily context questions
         if ask_questions:
@@ -310,6 +452,8 @@ class ContextCollectorAgent:
                 'timestamp': datetime.now().isoformat()
             }
         
+        weather = weather_future.result()
+        
         # Analyze temperature comfort
         comfort_analysis = self.analyze_temperature_comfort(weather['temperature'])
         
@@ -337,8 +481,7 @@ class ContextCollectorAgent:
             context: Context dictionary to save
             output_path: Path to output JSON file
         """
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(context, f, indent=2, ensure_ascii=False)
+        save_json(context, output_path)
         print(f"\n✓ 情境資料已儲存至: {output_path}")
     
     def print_context_summary(self, context: Dict):
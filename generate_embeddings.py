@@ -1,12 +1,123 @@
 import os
-import json
+import threading
 import numpy as np
 from pathlib import Path
 import clip
 import torch
+from torch.utils.data import Dataset, DataLoader
 from PIL import Image
 import tqdm
 
+from json_utils import save_json
+from score_kernels import dot_scores
+
+# Number of images encoded per forward pass
+BATCH_SIZE = 64
+# Worker processes used for image decode + preprocessing
+NUM_WORKERS = os.cpu_count() or 0
+# On-disk dtype of the embedding catalog; FP16 halves file size and scan bandwidth
+# with negligible effect on cosine similarity for CLIP embeddings
+EMBEDDING_DTYPE = np.float16
+# Input resolution of ViT-B/32; JPEGs are decoded no larger than needed for it
+CLIP_INPUT_SIZE = 224
+
+
+class OutfitImageDataset(Dataset):
+    """
+    Dataset yielding (preprocessed image tensor, index) for each image file.
+    Unreadable images yield None so a single bad file does not abort the run.
+    """
+    
+    def __init__(self, image_files, preprocess):
+        self.image_files = image_files
+        self.preprocess = preprocess
+    
+    def __len__(self):
+        return len(self.image_files)
+    
+    def __getitem__(self, idx):
+        image_path = self.image_files[idx]
+        try:
+            image = Image.open(image_path)
+            # Let libjpeg decode directly at reduced scale; CLIP only needs 224px input
+            image.draft('RGB', (CLIP_INPUT_SIZE, CLIP_INPUT_SIZE))
+            image = image.convert('RGB')
+            return self.preprocess(image), idx
+        except Exception as e:
+            print(f"Error processing {image_path.name}: {e}")
+            return None, idx
+
+
+def collate_images(samples):
+    """Stack the successfully loaded images of a batch, dropping failed ones."""
+    samples = [(tensor, idx) for tensor, idx in samples if tensor is not None]
+    if not samples:
+        return None, []
+    tensors, indices = zip(*samples)
+    return torch.stack(tensors), list(indices)
+
+
+def prefetch_to_device(loader, device, dtype):
+    """
+    Yield (images, indices) batches already moved to the device.
+    On CUDA the pinned host->device copy of the next batch runs on a side stream
+    while the current batch is being encoded on the default stream.
+    """
+    if device != "cuda":
+        for images, indices in loader:
+            if images is not None:
+                images = images.to(device, dtype=dtype)
+            yield images, indices
+        return
+    
+    copy_stream = torch.cuda.Stream()
+    pending = None
+    for images, indices in loader:
+        ready = None
+        if images is not None:
+            with torch.cuda.stream(copy_stream):
+                images = images.to(device, dtype=dtype, non_blocking=True)
+                ready = torch.cuda.Event()
+                ready.record(copy_stream)
+        if pending is not None:
+            yield _wait_for_copy(*pending)
+        pending = (images, indices, ready)
+    if pending is not None:
+        yield _wait_for_copy(*pending)
+
+
+def _wait_for_copy(images, indices, ready):
+    """Make the compute stream wait for a batch's copy before it is used."""
+    if ready is not None:
+        compute_stream = torch.cuda.current_stream()
+        compute_stream.wait_event(ready)
+        # Tell the caching allocator the tensor is now used on the compute stream
+        images.record_stream(compute_stream)
+    return images, indices
+
+
+def top_k_similar(query, catalog, k=5):
+    """
+    Find the k catalog embeddings most similar to a query embedding.
+    The catalog written by generate_clip_embeddings is L2-normalized, so the
+    dot product computed here equals cosine similarity.
+    
+    Returns:
+        (indices, scores) sorted by descending similarity
+    """
+    catalog = np.ascontiguousarray(catalog, dtype=np.float32)
+    query = np.asarray(query, dtype=np.float32).ravel()
+    query = query / (np.linalg.norm(query) + 1e-8)
+    
+    scores = dot_scores(catalog, query)
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return top, scores[top]
+
+
 def generate_clip_embeddings(folder_path, output_path, catalog_index_path=None):
     """
     Generate CLIP embeddings (512-dim) for all images in a folder.
@@ -19,56 +130,75 @@ def generate_clip_embeddings(folder_path, output_path, catalog_index_path=None):
     # Load CLIP model
     print("Loading CLIP model...")
     model, preprocess = clip.load("ViT-B/32", device=device)
+    if device == "cuda":
+        # Run ViT in FP16 on GPU (tensor cores)
+        model = model.half()
     
-    # Get all image files
-    folder = Path(folder_path)
+    # Get all image files in one directory scan, sorted to match rename_images.py
+    # (by numeric filename, non-numeric names last)
     image_extensions = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif', '.tiff'}
     
-    image_files = []
-    for file in folder.iterdir():
-        if file.is_file() and file.suffix.lower() in image_extensions:
-            image_files.append(file)
-    
-    # Sort to match the order from rename_images.py (by numeric filename)
-    def sort_key(f):
-        try:
-            # Try to extract numeric part from filename (e.g., "1.jpg" -> 1)
-            return int(f.stem)
-        except ValueError:
-            # Fall back to filename if not numeric
-            return float('inf')
+    entries = []
+    with os.scandir(folder_path) as it:
+        for entry in it:
+            stem, ext = os.path.splitext(entry.name)
+            if ext.lower() not in image_extensions or not entry.is_file():
+                continue
+            try:
+                numeric_key = int(stem)
+            except ValueError:
+                numeric_key = float('inf')
+            entries.append((numeric_key, entry.name, entry.path))
     
-    image_files.sort(key=sort_key)
+    entries.sort()
+    image_files = [Path(path) for _, _, path in entries]
     
     print(f"Found {len(image_files)} images")
     
-    # Generate embeddings
-    embeddings = []
-    
-    with torch.no_grad():
-        for image_path in tqdm.tqdm(image_files):
-            try:
-                # Load and preprocess image
-                image = Image.open(image_path).convert('RGB')
-                image_input = preprocess(image).unsqueeze(0).to(device)
-                
-                # Get embedding
-                embedding = model.encode_image(image_input)
-                
-                # Convert to numpy and append
-                embeddings.append(embedding.cpu().numpy().flatten())
-                
-            except Exception as e:
-                print(f"Error processing {image_path.name}: {e}")
-    
-    # Stack all embeddings into a single array
-    embeddings_array = np.vstack(embeddings)
+    # Decode and preprocess in DataLoader workers so the device never waits on JPEG decode
+    loader = DataLoader(
+        OutfitImageDataset(image_files, preprocess),
+        batch_size=BATCH_SIZE,
+        num_workers=NUM_WORKERS,
+        pin_memory=(device == "cuda"),
+        prefetch_factor=4 if NUM_WORKERS > 0 else None,
+        # Forking while other threads run (main_pipeline --parallel) can deadlock the workers
+        multiprocessing_context="spawn" if NUM_WORKERS > 0 and threading.active_count() > 1 else None,
+        collate_fn=collate_images
+    )
+    
+    # Write rows straight into a memory-mapped .npy instead of stacking them in RAM
+    embedding_dim = model.visual.output_dim
+    embeddings_array = np.lib.format.open_memmap(
+        output_path, mode='w+', dtype=EMBEDDING_DTYPE, shape=(len(image_files), embedding_dim)
+    )
+    write_idx = 0
+    processed_files = []
+    
+    with torch.inference_mode():
+        batches = prefetch_to_device(loader, device, model.dtype)
+        for images, indices in tqdm.tqdm(batches, total=len(loader)):
+            if images is None:
+                continue
+            batch_embeddings = model.encode_image(images).float()
+            # Store unit vectors so a plain dot product is the cosine similarity
+            batch_embeddings = batch_embeddings / batch_embeddings.norm(dim=-1, keepdim=True)
+            batch_embeddings = batch_embeddings.cpu().numpy()
+            embeddings_array[write_idx:write_idx + len(batch_embeddings)] = batch_embeddings
+            write_idx += len(batch_embeddings)
+            processed_files.extend(image_files[i] for i in indices)
+    
+    embeddings_array.flush()
+    
+    # Trim the unused tail rows left behind by images that failed to load
+    if write_idx < len(image_files):
+        trimmed = np.array(embeddings_array[:write_idx])
+        del embeddings_array
+        np.save(output_path, trimmed)
+        embeddings_array = trimmed
     
     print(f"\nEmbeddings shape: {embeddings_array.shape}")
-    print(f"Dimension per image: {embeddings_array.shape[1]}")
-    
-    # Save to .npy file
-    np.save(output_path, embeddings_array)
+    print(f"Dimension per image: {embeddings_array.shape[1]} ({embeddings_array.dtype})")
     print(f"\nSaved embeddings to: {output_path}")
     
     # Create and save catalog index for quick lookup
@@ -81,11 +211,10 @@ def generate_clip_embeddings(folder_path, output_path, catalog_index_path=None):
             "embedding_index": idx,
             "extension": file.suffix
         }
-        for idx, file in enumerate(image_files)
+        for idx, file in enumerate(processed_files)
     }
     
-    with open(catalog_index_path, 'w') as f:
-        json.dump(catalog_index, f, indent=2)
+    save_json(catalog_index, catalog_index_path)
     
     print(f"Saved catalog index to: {catalog_index_path}")
     
@@ -1,10 +1,50 @@
 import os
-import json
+import re
 import torch
 from pathlib import Path
 from PIL import Image
 import tqdm
-from transformers import AutoProcessor, LlavaForConditionalGeneration
+from transformers import AutoProcessor, LlavaForConditionalGeneration, BitsAndBytesConfig
+
+from json_utils import load_json, save_json
+
+try:
+    import flash_attn  # noqa: F401
+    HAS_FLASH_ATTN = True
+except ImportError:
+    HAS_FLASH_ATTN = False
+
+try:
+    import bitsandbytes  # noqa: F401
+    HAS_BITSANDBYTES = True
+except ImportError:
+    HAS_BITSANDBYTES = False
+
+# Input resolution of the LLaVA-1.5 vision tower
+LLAVA_INPUT_SIZE = 336
+# Images described per generate call (tune to available VRAM)
+DESCRIPTION_BATCH_SIZE = 4
+# Decode steps run by the compile warmup, so multi-token decode shapes are captured too
+WARMUP_NEW_TOKENS = 8
+
+# "KEY: value" lines of the LLaVA response, matched in one pass over the text
+_RESPONSE_LINE_PATTERN = re.compile(r'^\s*([A-Za-z_]+)\s*:(.*)$', re.MULTILINE)
+_RESPONSE_KEY_MAP = {
+    "TYPE": "type",
+    "CATEGORY": "category",
+    "SUBCATEGORY": "subcategory",
+    "COLOR_PRIMARY": "color_primary",
+    "COLOR_SECONDARY": "color_secondary",
+    "PATTERN": "pattern",
+    "MATERIAL": "material",
+    "SLEEVE_LENGTH": "sleeve_length",
+    "LENGTH": "length",
+    "STYLE_AESTHETIC": "style_aesthetic",
+    "FIT_SILHOUETTE": "fit_silhouette",
+    "COMPLETE_DESCRIPTION": "complete_description",
+}
+# Fields that fall back to "N/A" when the model leaves them empty
+_NA_DEFAULT_FIELDS = {"color_secondary", "sleeve_length"}
 
 def generate_outfit_descriptions(folder_path, output_path):
     """
@@ -15,38 +55,80 @@ def generate_outfit_descriptions(folder_path, output_path):
     device = "cuda" if torch.cuda.is_available() else "cpu"
     print(f"Using device: {device}")
     
+    # Get all image files in one directory scan, sorted to match rename_images.py
+    # (by numeric filename, non-numeric names last)
+    image_extensions = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif', '.tiff'}
+    
+    entries = []
+    with os.scandir(folder_path) as it:
+        for entry in it:
+            stem, ext = os.path.splitext(entry.name)
+            if ext.lower() not in image_extensions or not entry.is_file():
+                continue
+            try:
+                numeric_key = int(stem)
+            except ValueError:
+                numeric_key = float('inf')
+            entries.append((numeric_key, entry.name, entry.path))
+    
+    entries.sort()
+    image_files = [Path(path) for _, _, path in entries]
+    
+    print(f"Found {len(image_files)} images")
+    
+    # Resume: keep existing error-free descriptions and only describe the rest
+    existing = {}
+    if os.path.exists(output_path):
+        try:
+            existing = load_json(output_path)
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not read existing descriptions ({e}); regenerating all")
+    
+    pending_files = [
+        f for f in image_files
+        if f.name not in existing or existing[f.name].get('error')
+    ]
+    print(f"{len(image_files) - len(pending_files)} already described, {len(pending_files)} to process")
+    
+    if not pending_files:
+        # Nothing to describe, but entries for images removed from the folder still drop out
+        outfit_descriptions = _merge_descriptions({}, existing, image_files)
+        if list(outfit_descriptions) != list(existing):
+            _save_descriptions(outfit_descriptions, output_path)
+            print(f"Pruned {len(existing) - len(outfit_descriptions)} entries for removed images")
+        print(f"\nOutfit descriptions are up to date: {output_path}")
+        return
+    
     # Load LLaVA model
     print("Loading LLaVA Vision Language Model...")
     model_id = "llava-hf/llava-1.5-7b-hf"
     processor = AutoProcessor.from_pretrained(model_id)
+    # FlashAttention-2 fuses the attention kernels on GPU; otherwise use PyTorch SDPA
+    attn_implementation = "flash_attention_2" if device == "cuda" and HAS_FLASH_ATTN else "sdpa"
+    # NF4 4-bit weights cut VRAM ~4x (room for larger batches); needs CUDA + bitsandbytes
+    quantize = device == "cuda" and HAS_BITSANDBYTES
+    quantization_config = BitsAndBytesConfig(
+        load_in_4bit=True,
+        bnb_4bit_compute_dtype=torch.float16,
+        bnb_4bit_quant_type="nf4"
+    ) if quantize else None
     model = LlavaForConditionalGeneration.from_pretrained(
         model_id,
         torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-        device_map="auto" if device == "cuda" else None
+        device_map="auto" if device == "cuda" else None,
+        attn_implementation=attn_implementation,
+        quantization_config=quantization_config,
+        use_safetensors=True,
+        low_cpu_mem_usage=True
     )
     
+    # Compile forward (what generate() calls) so Inductor can fuse the decoder kernels;
+    # skipped for 4-bit models, whose bitsandbytes kernels do not compile cleanly
+    compiled = device == "cuda" and not quantize
     if device == "cpu":
         model = model.to(device)
-    
-    # Get all image files
-    folder = Path(folder_path)
-    image_extensions = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif', '.tiff'}
-    
-    image_files = []
-    for file in folder.iterdir():
-        if file.is_file() and file.suffix.lower() in image_extensions:
-            image_files.append(file)
-    
-    # Sort by numeric filename
-    def sort_key(f):
-        try:
-            return int(f.stem)
-        except ValueError:
-            return float('inf')
-    
-    image_files.sort(key=sort_key)
-    
-    print(f"Found {len(image_files)} images")
+    elif compiled:
+        model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=False)
     
     # Prompt for detailed outfit analysis
     analysis_prompt = """Analyze this outfit image in detail and provide structured information about the clothing item/outfit shown. 
@@ -79,64 +161,88 @@ def generate_outfit_descriptions(folder_path, output_path):
     FIT_SILHOUETTE: [fit type]
     COMPLETE_DESCRIPTION: [2-3 sentence description]"""
     
-    # Generate descriptions
+    # Left-pad so every prompt in a batch ends right where generation starts
+    processor.tokenizer.padding_side = "left"
+    
+    if compiled:
+        # Trigger compilation once up front instead of inside the first real batch:
+        # a full left-padded batch decoding several tokens, so the prefill and decode
+        # shapes the real batches use are compiled/captured here
+        print("Warming up compiled model...")
+        warmup_images = [Image.new('RGB', (LLAVA_INPUT_SIZE, LLAVA_INPUT_SIZE))] * DESCRIPTION_BATCH_SIZE
+        warmup_inputs = processor(
+            images=warmup_images,
+            text=[analysis_prompt] * DESCRIPTION_BATCH_SIZE,
+            return_tensors="pt",
+            padding=True
+        ).to(device)
+        with torch.no_grad():
+            model.generate(
+                **warmup_inputs,
+                max_new_tokens=WARMUP_NEW_TOKENS,
+                min_new_tokens=WARMUP_NEW_TOKENS,
+                do_sample=False,
+                num_beams=1
+            )
+    
+    # Generate descriptions, DESCRIPTION_BATCH_SIZE images per generate call
     outfit_descriptions = {}
     
-    for image_path in tqdm.tqdm(image_files):
-        try:
-            # Load and preprocess image
-            image = Image.open(image_path).convert('RGB')
-            
-            # Prepare inputs
-            inputs = processor(images=image, text=analysis_prompt, return_tensors="pt")
-            
-            # Move to device
-            for key in inputs:
-                if isinstance(inputs[key], torch.Tensor):
-                    inputs[key] = inputs[key].to(device)
-            
-            # Generate response
-            with torch.no_grad():
-                output_ids = model.generate(
-                    **inputs,
-                    max_new_tokens=300,
-                    do_sample=True,
-                    temperature=0.7,
-                    top_p=0.9
-                )
-            
-            # Decode response
-            response = processor.decode(output_ids[0], skip_special_tokens=True)
-            
-            # Parse the response
-            outfit_data = parse_outfit_response(response)
-            outfit_descriptions[image_path.name] = outfit_data
-            
-        except Exception as e:
-            print(f"Error processing {image_path.name}: {e}")
-            # Add error entry
-            outfit_descriptions[image_path.name] = {
-                "type": "Unknown",
-                "category": "Unknown",
-                "subcategory": "Unknown",
-                "color_primary": "Unknown",
-                "color_secondary": "N/A",
-                "pattern": "Unknown",
-                "material": "Unknown",
-                "sleeve_length": "N/A",
-                "length": "Unknown",
-                "style_aesthetic": "Unknown",
-                "fit_silhouette": "Unknown",
-                "complete_description": f"Error processing image: {str(e)}",
-                "error": True
-            }
-    
-    # Save to JSON file
-    with open(output_path, 'w') as f:
-        json.dump(outfit_descriptions, f, indent=2)
+    for start in tqdm.tqdm(range(0, len(pending_files), DESCRIPTION_BATCH_SIZE)):
+        chunk = pending_files[start:start + DESCRIPTION_BATCH_SIZE]
+        chunk_results = {}
+        images, batch_paths = [], []
+        
+        for image_path in chunk:
+            try:
+                # Load and preprocess image
+                image = Image.open(image_path)
+                # Let libjpeg decode directly at reduced scale; LLaVA-1.5 only needs 336px input
+                image.draft('RGB', (LLAVA_INPUT_SIZE, LLAVA_INPUT_SIZE))
+                images.append(image.convert('RGB'))
+                batch_paths.append(image_path)
+            except Exception as e:
+                print(f"Error processing {image_path.name}: {e}")
+                chunk_results[image_path.name] = _error_entry(e)
+        
+        if images:
+            try:
+                # Prepare inputs
+                inputs = processor(
+                    images=images,
+                    text=[analysis_prompt] * len(images),
+                    return_tensors="pt",
+                    padding=True
+                ).to(device)
+                
+                # Generate responses (greedy: the output is a fixed key/value form)
+                with torch.no_grad():
+                    output_ids = model.generate(
+                        **inputs,
+                        max_new_tokens=200,
+                        do_sample=False,
+                        num_beams=1
+                    )
+                
+                # Decode and parse each row
+                responses = processor.batch_decode(output_ids, skip_special_tokens=True)
+                for image_path, response in zip(batch_paths, responses):
+                    chunk_results[image_path.name] = parse_outfit_response(response)
+                
+            except Exception as e:
+                print(f"Error processing batch {', '.join(p.name for p in batch_paths)}: {e}")
+                for image_path in batch_paths:
+                    chunk_results[image_path.name] = _error_entry(e)
+        
+        # Keep output ordered like image_files
+        for image_path in chunk:
+            outfit_descriptions[image_path.name] = chunk_results[image_path.name]
+    
+    outfit_descriptions = _merge_descriptions(outfit_descriptions, existing, image_files)
+    _save_descriptions(outfit_descriptions, output_path)
     
     print(f"\nSaved outfit descriptions to: {output_path}")
-    print(f"Successfully processed {len(outfit_descriptions)} images")
+    print(f"Successfully processed {len(pending_files)} images ({len(outfit_descriptions)} total)")
     
     # Print sample entries
     print(f"\nSample descriptions (first 2 items):")
@@ -146,11 +252,48 @@ def generate_outfit_descriptions(folder_path, output_path):
         print(f"  Color: {data.get('color_primary', 'Unknown')}")
         print(f"  Style: {data.get('style_aesthetic', 'Unknown')}")
 
+def _merge_descriptions(new, existing, image_files):
+    """
+    Merge new descriptions with the reused entries in image order
+    (images no longer in the folder drop out).
+    """
+    return {
+        f.name: new.get(f.name, existing.get(f.name))
+        for f in image_files
+    }
+
+def _save_descriptions(outfit_descriptions, output_path):
+    """
+    Save to JSON file atomically so an interrupted run keeps the previous file intact.
+    """
+    tmp_path = f"{output_path}.tmp"
+    save_json(outfit_descriptions, tmp_path)
+    os.replace(tmp_path, output_path)
+
+def _error_entry(error):
+    """
+    Build the placeholder entry recorded for an image that could not be described.
+    """
+    return {
+        "type": "Unknown",
+        "category": "Unknown",
+        "subcategory": "Unknown",
+        "color_primary": "Unknown",
+        "color_secondary": "N/A",
+        "pattern": "Unknown",
+        "material": "Unknown",
+        "sleeve_length": "N/A",
+        "length": "Unknown",
+        "style_aesthetic": "Unknown",
+        "fit_silhouette": "Unknown",
+        "complete_description": f"Error processing image: {str(error)}",
+        "error": True
+    }
+
 def parse_outfit_response(response):
     """
     Parse the LLaVA response into structured outfit data.
     """
-    lines = response.split('\n')
     outfit_data = {
         "type": "Unknown",
         "category": "Unknown",
@@ -166,38 +309,15 @@ def parse_outfit_response(response):
         "complete_description": ""
     }
     
-    # Parse key-value pairs from response
-    for line in lines:
-        if ':' in line:
-            key, value = line.split(':', 1)
-            key = key.strip().upper()
-            value = value.strip()
-            
-            # Map to outfit data keys
-            if key == "TYPE":
-                outfit_data["type"] = value
-            elif key == "CATEGORY":
-                outfit_data["category"] = value
-            elif key == "SUBCATEGORY":
-                outfit_data["subcategory"] = value
-            elif key == "COLOR_PRIMARY":
-                outfit_data["color_primary"] = value
-            elif key == "COLOR_SECONDARY":
-                outfit_data["color_secondary"] = value if value else "N/A"
-            elif key == "PATTERN":
-                outfit_data["pattern"] = value
-            elif key == "MATERIAL":
-                outfit_data["material"] = value
-            elif key == "SLEEVE_LENGTH":
-                outfit_data["sleeve_length"] = value if value else "N/A"
-            elif key == "LENGTH":
-                outfit_data["length"] = value
-            elif key == "STYLE_AESTHETIC":
-                outfit_data["style_aesthetic"] = value
-            elif key == "FIT_SILHOUETTE":
-                outfit_data["fit_silhouette"] = value
-            elif key == "COMPLETE_DESCRIPTION":
-                outfit_data["complete_description"] = value
+    # Parse key-value pairs from response in a single regex pass
+    for match in _RESPONSE_LINE_PATTERN.finditer(response):
+        field = _RESPONSE_KEY_MAP.get(match.group(1).upper())
+        if field is None:
+            continue
+        value = match.group(2).strip()
+        if not value and field in _NA_DEFAULT_FIELDS:
+            value = "N/A"
+        outfit_data[field] = value
     
     return outfit_data
 
@@ -0,0 +1,134 @@
+"""
+JSON Utilities
+Fast JSON read/write helpers shared by the pipeline scripts.
+Uses orjson (native, SIMD-accelerated) when installed and falls back to the standard json module.
+"""
+
+import os
+import json
+import functools
+from typing import Any
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+def dumps_json(data: Any, indent: bool = True) -> str:
+    """
+    Serialize data to a JSON string (non-ASCII characters kept as is).
+
+    Args:
+        data: JSON-serializable object
+        indent: Pretty-print with 2-space indentation
+
+    Returns:
+        JSON string
+    """
+    if HAS_ORJSON:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(data, option=option).decode('utf-8')
+    return json.dumps(data, indent=2 if indent else None, ensure_ascii=False)
+
+
+def dumps_json_bytes(data: Any, indent: bool = True) -> bytes:
+    """
+    Serialize data to UTF-8 encoded JSON bytes.
+
+    Args:
+        data: JSON-serializable object
+        indent: Pretty-print with 2-space indentation
+
+    Returns:
+        UTF-8 JSON bytes
+    """
+    if HAS_ORJSON:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(data, option=option)
+    return json.dumps(data, indent=2 if indent else None, ensure_ascii=False).encode('utf-8')
+
+
+def save_json(data: Any, path: str, indent: bool = True):
+    """
+    Write data to a UTF-8 JSON file.
+
+    Args:
+        data: JSON-serializable object
+        path: Output file path
+        indent: Pretty-print with 2-space indentation
+    """
+    if HAS_ORJSON:
+        with open(path, 'wb') as f:
+            f.write(dumps_json_bytes(data, indent))
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2 if indent else None, ensure_ascii=False)
+
+
+def loads_json(data) -> Any:
+    """
+    Parse a JSON document from str or bytes.
+
+    Args:
+        data: JSON text
+
+    Returns:
+        Parsed JSON object
+    """
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _read_bytes(path: str) -> bytes:
+    """Read a whole file with raw os.read calls sized from fstat (no buffered file object)."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        data = os.read(fd, size)
+        while len(data) < size:
+            chunk = os.read(fd, size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+    finally:
+        os.close(fd)
+
+
+def load_json(path: str) -> Any:
+    """
+    Read a UTF-8 JSON file.
+
+    Args:
+        path: Input file path
+
+    Returns:
+        Parsed JSON object
+    """
+    return loads_json(_read_bytes(path))
+
+
+@functools.lru_cache(maxsize=8)
+def _load_json_versioned(path: str, mtime_ns: int, size: int) -> Any:
+    """Parse a JSON file; the (mtime_ns, size) arguments only key the cache."""
+    return load_json(path)
+
+
+def load_json_cached(path: str) -> Any:
+    """
+    Read a JSON file, reusing the previous parse while the file is unchanged.
+    The cache is keyed on the file's mtime and size, so edits invalidate it
+    automatically. The returned object is shared between callers: copy it
+    before mutating.
+
+    Args:
+        path: Input file path
+
+    Returns:
+        Parsed JSON object
+    """
+    st = os.stat(path)
+    return _load_json_versioned(os.fspath(path), st.st_mtime_ns, st.st_size)
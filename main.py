@@ -1,5 +1,7 @@
-import os
-import json
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 
 # 匯入各個模組
@@ -11,20 +13,58 @@ try:
 except ImportError:
     print("Warning: Step 1.5/2 modules not found. Using mocks if available.")
 
-# 匯入 Step 3 (注意路徑)
-from outfit_planner.recommend_v2 import HybridRecommender
-from standardize_categories import standardize_data
+from json_utils import dumps_json_bytes, load_json
+from main_pipeline import ensure_standardized
 
 # 載入環境變數 (OpenAI Key)
 load_dotenv()
 
-def main():
+# Step 1 資料與 Step 3 模組都以本檔所在目錄為準，不受執行時 cwd 影響
+_HERE = Path(__file__).resolve().parent
+# outfit_planner.py 會遮蔽 outfit_planner/ 目錄，Step 3 模組直接從目錄匯入
+PLANNER_DIR = _HERE / "outfit_planner"
+
+
+@dataclass(slots=True)
+class ContextData:
+    """Daily context collected in Step 2."""
+    weather: str
+    location: str
+    occasion: str
+    user_query: str
+
+
+@dataclass(slots=True)
+class UserStyle:
+    """User style profile from Step 1.5."""
+    personal_color: str
+    style_preferences: List[str]
+    gender: str
+
+
+@dataclass(slots=True)
+class Step3Input:
+    """Input schema for Step 3 (Outfit Planner), built once from the collected context."""
+    user_query: str
+    weather: str
+    occasion: str
+    user_profile: UserStyle
+    constraints: Dict[str, Any] = field(default_factory=dict)  # 可選
+
+
+def main(batch_path: Optional[str] = None):
+    """
+    Args:
+        batch_path: Optional JSON file with a list of additional Step 3 inputs
+                    (objects with the Step3Input fields) to recommend in the same batch.
+                    outfit_recommendation.json always holds the single recommendation
+                    for the collected context; the whole batch, in input order, is
+                    written as a list to outfit_recommendation_batch.json
+    """
     print("=== System Start: AI Outfit Agent ===")
 
     # 0. 前置檢查與資料準備
-    if not os.path.exists("catalog_standardized.json"):
-        print("Building standardized catalog...")
-        standardize_data()
+    ensure_standardized()
 
     # --- Step 1.5 & 2: Context Collection ---
     print("\n--- Step 2: Collecting Context ---")
@@ -35,12 +75,12 @@ def main():
     
     # 為了示範，我們先模擬一個從 Context Collector 拿到的資料結構
     # 這應該要替換成真正的 function call
-    context_data = {
-        "weather": "Sunny, 28°C",
-        "location": "Taipei",
-        "occasion": "Casual Weekend Date",
-        "user_query": "I want something cute and breathable."
-    }
+    context_data = ContextData(
+        weather="Sunny, 28°C",
+        location="Taipei",
+        occasion="Casual Weekend Date",
+        user_query="I want something cute and breathable.",
+    )
     print(f"Context Acquired: {context_data}")
 
     print("\n--- Step 1.5: User Profile ---")
@@ -48,38 +88,60 @@ def main():
     # profile_mgr = UserProfileManager()
     # user_style = profile_mgr.get_profile("user_123")
     
-    user_style = {
-        "personal_color": "Summer Mute",
-        "style_preferences": ["Minimalist", "Pastel Colors"],
-        "gender": "Female"
-    }
+    user_style = UserStyle(
+        personal_color="Summer Mute",
+        style_preferences=["Minimalist", "Pastel Colors"],
+        gender="Female",
+    )
     print(f"User Style: {user_style}")
 
     # --- Step 3: Outfit Planning ---
     print("\n--- Step 3: Planning Outfit ---")
     
+    # 匯入 Step 3 (注意路徑)；延遲到此處才載入，避免前面步驟負擔模型相關的匯入成本
+    if str(PLANNER_DIR) not in sys.path:
+        sys.path.insert(0, str(PLANNER_DIR))
+    from recommend_v2 import HybridRecommender
+    
     # 初始化 Recommender (它會自動載入 Step 1 的資料)
-    recommender = HybridRecommender(base_path=".") 
+    recommender = HybridRecommender(base_path=str(_HERE))
+    # 先觸發評分函式的 JIT 編譯，避免第一次推薦時才付出編譯成本
+    recommender.warmup()
     
     # 準備輸入給 Step 3 (整合所有 Context)
-    step3_input = {
-        "user_query": context_data["user_query"],
-        "weather": context_data["weather"],
-        "occasion": context_data["occasion"],
-        "user_profile": user_style,
-        "constraints": {} # 可選
-    }
+    step3_input = Step3Input(
+        user_query=context_data.user_query,
+        weather=context_data.weather,
+        occasion=context_data.occasion,
+        user_profile=user_style,
+    )
+
+    step3_inputs = [step3_input]
+    if batch_path:
+        for item in load_json(batch_path):
+            step3_inputs.append(Step3Input(**{**item, "user_profile": UserStyle(**item["user_profile"])}))
 
-    # 執行推薦
-    final_decision = recommender.recommend_outfit(step3_input)
+    # 執行推薦 (所有輸入一次批次檢索：一次編碼、一次矩陣乘法)
+    decisions = recommender.recommend_outfit_batch(step3_inputs)
+    final_decision = decisions[0]
 
     # --- Step 4 Handoff ---
     print("\n=== Final Recommendation (Ready for Presenter) ===")
-    print(json.dumps(final_decision, indent=2, ensure_ascii=False))
+    # 只序列化一次：同一份 bytes 直接寫到 stdout 與 outfit_recommendation.json
+    payload = dumps_json_bytes(final_decision)
+    sys.stdout.flush()
+    sys.stdout.buffer.write(payload + b"\n")
+    sys.stdout.buffer.flush()
+    with open(_HERE / "outfit_recommendation.json", "wb") as f:
+        f.write(payload)
+    if batch_path:
+        with open(_HERE / "outfit_recommendation_batch.json", "wb") as f:
+            f.write(dumps_json_bytes(decisions))
+        print(f"Info: {len(decisions)} batch recommendations saved to outfit_recommendation_batch.json")
 
     # 這裡的 output 就可以直接傳給 Virtual Try-On 模組
-    # final_decision['selected_outfit']['id'] -> 圖片檔名
-    # final_decision['vton_prompt'] -> 生成提示詞
+    # final_decision['selected_outfit']['filename'] -> 圖片檔名
+    # final_decision['vton_generation_prompt'] -> 生成提示詞
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
\ No newline at end of file
@@ -8,25 +8,62 @@ Integrates all steps:
 
 import os
 import sys
-import json
-import argparse
+import hashlib
+import importlib.util
+import functools
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from types import SimpleNamespace
 from datetime import datetime
 from typing import Optional, Dict
 
+from json_utils import load_json, load_json_cached, save_json, loads_json, dumps_json_bytes
+
+# Paths resolved once at import instead of re-joined on every call
+_HERE = Path(__file__).resolve().parent
+OUTFITS_DIR = _HERE / 'outfits'
+EMBEDDINGS_NPY = _HERE / 'outfit_embeddings.npy'
+CATALOG_JSON = _HERE / 'catalog_index.json'
+DESCRIPTIONS_JSON = _HERE / 'outfit_descriptions.json'
+CATALOG_COLUMNS_NPZ = _HERE / 'catalog_columns.npz'
+STANDARDIZED_JSON = _HERE / 'catalog_standardized.json'
+USER_PROFILE_JSON = _HERE / 'user_profile.json'
+DAILY_CONTEXT_JSON = _HERE / 'daily_context.json'
+
+
+@functools.lru_cache(maxsize=1)
+def _present_files() -> frozenset:
+    """Names in the pipeline directory, read with a single os.scandir pass."""
+    with os.scandir(_HERE) as it:
+        return frozenset(entry.name for entry in it)
+
+
+def file_exists(filename: str) -> bool:
+    """Check whether a file exists in the pipeline directory using the cached listing."""
+    return filename in _present_files()
+
+
+def refresh_present_files():
+    """Invalidate the cached directory listing after the pipeline writes files."""
+    _present_files.cache_clear()
+
 
 def check_dependencies():
-    """Check if all required files exist."""
-    required_files = {
-        'outfit_descriptions.json': 'Outfit descriptions (from step 1)',
-        'outfit_embeddings.npy': 'Outfit embeddings (from step 1)',
-        'catalog_index.json': 'Catalog index (from step 1)',
-        'generate_embeddings.py': 'Step 1a: Generate embeddings',
-        'generate_outfit_descriptions.py': 'Step 1b: Generate descriptions',
-        'user_profile_manager.py': 'Step 2a: User profile manager',
-        'context_collector_agent.py': 'Step 2b: Context collector',
-        'outfit_planner.py': 'Step 3: Outfit planner',
-        'standardize_categories.py': 'Data standardization (category mapping)'
+    """Check if all required artifacts and pipeline modules are available."""
+    required_artifacts = {
+        DESCRIPTIONS_JSON: 'Outfit descriptions (from step 1)',
+        EMBEDDINGS_NPY: 'Outfit embeddings (from step 1)',
+        CATALOG_JSON: 'Catalog index (from step 1)',
+    }
+    # Resolved through the import system so installed modules count too
+    required_modules = {
+        'generate_embeddings': 'Step 1a: Generate embeddings',
+        'generate_outfit_descriptions': 'Step 1b: Generate descriptions',
+        'user_profile_manager': 'Step 2a: User profile manager',
+        'context_collector_agent': 'Step 2b: Context collector',
+        'outfit_planner': 'Step 3: Outfit planner',
+        'standardize_categories': 'Data standardization (category mapping)'
     }
     
     print("\n" + "="*60)
@@ -34,94 +71,254 @@ def check_dependencies():
     print("="*60)
     
     missing = []
-    for filename, description in required_files.items():
-        if os.path.exists(filename):
+    for path, description in required_artifacts.items():
+        # Step 1 writes these next to this file, so probe the resolved paths (not the cwd)
+        filename = path.name
+        if path.exists():
             print(f"✓ {filename:<40} {description}")
         else:
             print(f"✗ {filename:<40} ⚠️  {description}")
             missing.append(filename)
     
+    for module, description in required_modules.items():
+        if importlib.util.find_spec(module) is not None:
+            print(f"✓ {module:<40} {description}")
+        else:
+            print(f"✗ {module:<40} ⚠️  {description}")
+            missing.append(module)
+    
     return len(missing) == 0, missing
 
 
-def run_step_1_catalog_builder():
+# Full tracebacks on errors (--verbose); otherwise errors are reported as one line
+VERBOSE = False
+
+
+def print_traceback():
+    """Print the current exception's traceback when running with --verbose."""
+    if VERBOSE:
+        import traceback
+        traceback.print_exc()
+
+
+CATALOG_MANIFEST = _HERE / '.catalog_manifest.json'
+
+
+def compute_catalog_digest(folder: str) -> Optional[str]:
+    """
+    Fingerprint the outfits folder from its sorted (filename, mtime, size) entries.
+    Cheap to compute (one directory scan, no file reads) and changes whenever
+    an image is added, removed or replaced.
+    
+    Args:
+        folder: Outfit images folder
+        
+    Returns:
+        Hex digest, or None if the folder does not exist
+    """
+    if not os.path.isdir(folder):
+        return None
+    
+    entries = []
+    with os.scandir(folder) as it:
+        for entry in it:
+            if entry.is_file():
+                st = entry.stat()
+                entries.append((entry.name, st.st_mtime_ns, st.st_size))
+    entries.sort()
+    
+    digest = hashlib.blake2b(digest_size=16, usedforsecurity=False)
+    for name, mtime_ns, size in entries:
+        digest.update(f"{name}\0{mtime_ns}\0{size}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def compute_file_digest(path: str) -> Optional[str]:
+    """Fingerprint a single file from its mtime and size (None if missing)."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def load_catalog_manifest() -> Dict:
+    """Load the catalog manifest recording which inputs the artifacts were built from."""
+    if not file_exists(CATALOG_MANIFEST.name):
+        return {}
+    try:
+        return load_json(str(CATALOG_MANIFEST))
+    except (OSError, ValueError):
+        return {}
+
+
+def update_catalog_manifest(**entries):
+    """Merge entries into the catalog manifest."""
+    manifest = load_catalog_manifest()
+    manifest.update(entries)
+    save_json(manifest, str(CATALOG_MANIFEST))
+    refresh_present_files()
+
+
+def load_embeddings(path: Path = EMBEDDINGS_NPY):
+    """
+    Open the outfit embeddings as a read-only memory map.
+    Rows are paged in from the OS page cache on demand instead of being
+    deserialized into RAM on every pipeline start.
+    
+    Args:
+        path: Path to the embeddings .npy file
+        
+    Returns:
+        numpy memmap of shape (n_items, dim)
+    """
+    import numpy as np
+    return np.load(path, mmap_mode='r')
+
+
+def _build_embeddings() -> bool:
+    """Step 1a: generate CLIP embeddings and the catalog index."""
+    print("\n[1a] 正在生成衣服 embeddings...")
+    try:
+        from generate_embeddings import generate_clip_embeddings
+        generate_clip_embeddings(str(OUTFITS_DIR), str(EMBEDDINGS_NPY), str(CATALOG_JSON))
+        print("✓ Embeddings 生成完成")
+        return True
+    except Exception as e:
+        print(f"✗ Embeddings 生成失敗: {e}")
+        return False
+
+
+def _build_descriptions() -> bool:
+    """Step 1b: generate LLaVA outfit descriptions."""
+    print("\n[1b] 正在生成衣服文字描述...")
+    try:
+        from generate_outfit_descriptions import generate_outfit_descriptions
+        generate_outfit_descriptions(str(OUTFITS_DIR), str(DESCRIPTIONS_JSON))
+        print("✓ 文字描述生成完成")
+        return True
+    except Exception as e:
+        print(f"✗ 文字描述生成失敗: {e}")
+        return False
+
+
+def _build_catalog_columns() -> bool:
+    """Step 1c: write the columnar catalog consumed by the outfit planner filters."""
+    print("\n[1c] 正在建立欄位式目錄 (catalog_columns.npz)...")
+    try:
+        from outfit_planner import save_catalog_columns
+        save_catalog_columns(str(DESCRIPTIONS_JSON), str(CATALOG_JSON), str(CATALOG_COLUMNS_NPZ))
+        refresh_present_files()
+        print("✓ 欄位式目錄建立完成")
+        return True
+    except Exception as e:
+        print(f"✗ 欄位式目錄建立失敗: {e}")
+        return False
+
+
+def run_step_1_catalog_builder(parallel: bool = False):
     """
     Step 1: Catalog Builder
     Generate embeddings and descriptions for all outfits.
+    
+    Args:
+        parallel: Run embedding and description generation concurrently.
+            Off by default: CLIP and LLaVA then share the GPU at the same time
     """
     print("\n" + "="*60)
     print("📚 第 1 步: 衣服目錄前處理 (Catalog Builder)")
     print("="*60)
     
     # Check if embeddings and descriptions already exist
-    embeddings_exist = os.path.exists('outfit_embeddings.npy')
-    descriptions_exist = os.path.exists('outfit_descriptions.json')
-    catalog_exist = os.path.exists('catalog_index.json')
+    # Step 1 outputs live next to this file, wherever the pipeline is run from
+    embeddings_exist = EMBEDDINGS_NPY.exists()
+    descriptions_exist = DESCRIPTIONS_JSON.exists()
+    catalog_exist = CATALOG_JSON.exists()
+    columns_exist = CATALOG_COLUMNS_NPZ.exists()
+    
+    # Compare the outfits folder against the fingerprint the artifacts were built from
+    outfits_digest = compute_catalog_digest(str(OUTFITS_DIR))
+    built_digest = load_catalog_manifest().get('outfits')
     
     if embeddings_exist and descriptions_exist and catalog_exist:
-        print("\n✓ 衣服目錄資料已存在，跳過生成步驟")
-        print("  - outfit_embeddings.npy")
-        print("  - outfit_descriptions.json")
-        print("  - catalog_index.json")
-        return True
+        if built_digest is None or built_digest == outfits_digest:
+            if built_digest is None:
+                # Artifacts predate the manifest: adopt them as built from the current folder
+                update_catalog_manifest(outfits=outfits_digest)
+            if not columns_exist:
+                # Derived from the JSON outputs only; cheap to rebuild
+                _build_catalog_columns()
+            print("\n✓ 衣服目錄資料已存在，跳過生成步驟")
+            print("  - outfit_embeddings.npy")
+            print("  - outfit_descriptions.json")
+            print("  - catalog_index.json")
+            print("  - catalog_columns.npz")
+            return True
+        
+        print("\n⚠️  偵測到 outfits/ 資料夾已變更，重新生成衣服目錄資料")
+        embeddings_exist = descriptions_exist = catalog_exist = False
     
     print("\n執行衣服目錄前處理...")
     
-    # Step 1a: Generate embeddings
+    # Step 1a (CLIP, GPU/CPU-bound) and Step 1b (LLaVA) write independent outputs
+    tasks = []
     if not embeddings_exist or not catalog_exist:
-        print("\n[1a] 正在生成衣服 embeddings...")
-        try:
-            from generate_embeddings import generate_clip_embeddings
-            outfits_folder = os.path.join(os.path.dirname(__file__), "outfits")
-            output_file = os.path.join(os.path.dirname(__file__), "outfit_embeddings.npy")
-            catalog_index_file = os.path.join(os.path.dirname(__file__), "catalog_index.json")
-            
-            generate_clip_embeddings(outfits_folder, output_file, catalog_index_file)
-            print("✓ Embeddings 生成完成")
-        except Exception as e:
-            print(f"✗ Embeddings 生成失敗: {e}")
-            return False
+        tasks.append(_build_embeddings)
     else:
         print("\n[1a] ✓ 衣服 embeddings 已存在")
     
-    # Step 1b: Generate descriptions
     if not descriptions_exist:
-        print("\n[1b] 正在生成衣服文字描述...")
-        try:
-            from generate_outfit_descriptions import generate_outfit_descriptions
-            outfits_folder = os.path.join(os.path.dirname(__file__), "outfits")
-            output_file = os.path.join(os.path.dirname(__file__), "outfit_descriptions.json")
-            
-            generate_outfit_descriptions(outfits_folder, output_file)
-            print("✓ 文字描述生成完成")
-        except Exception as e:
-            print(f"✗ 文字描述生成失敗: {e}")
-            return False
+        tasks.append(_build_descriptions)
     else:
         print("\n[1b] ✓ 衣服文字描述已存在")
     
+    if parallel and len(tasks) > 1:
+        # Overlap both legs so Step 1 takes max(t_embed, t_desc) instead of the sum
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            futures = [executor.submit(task) for task in tasks]
+            results = [future.result() for future in as_completed(futures)]
+    else:
+        results = [task() for task in tasks]
+    
+    refresh_present_files()
+    if not all(results):
+        return False
+    
+    # Step 1c: columnar (SoA) copy of descriptions + index for vectorized filtering
+    if not _build_catalog_columns():
+        return False
+    
+    update_catalog_manifest(outfits=outfits_digest)
     print("\n✓ 第 1 步完成：衣服目錄前處理")
-    # 在第 1 步結束後立即嘗試執行分類標準化，以便產生 `catalog_standardized.json`
-    try:
-        run_standardize_categories()
-    except Exception:
-        # non-fatal: 紀錄警告後繼續，讓後續步驟仍能執行
-        print("⚠️  分類標準化步驟發生錯誤，將繼續執行後續步驟")
-
     return True
 
 
-def run_standardize_categories():
+def ensure_standardized() -> bool:
     """
-    Run category standardization to normalize item categories.
-    This produces `catalog_standardized.json` used to improve recommendation quality.
+    Make sure `catalog_standardized.json` (normalized item categories) is up to date.
+    Single entry point for the pipeline and main.py: the work is skipped when the
+    manifest shows it was built from the current descriptions. Failures are
+    reported but not raised, so later steps can still run.
+    
+    Returns:
+        True if the standardized catalog is current
     """
     print("\n" + "="*60)
     print("🔧 執行分類標準化 (standardize_categories)")
     print("="*60)
+    
+    # Skip when the standardized catalog was built from the current descriptions
+    descriptions_digest = compute_file_digest(DESCRIPTIONS_JSON)
+    if (file_exists(STANDARDIZED_JSON.name) and descriptions_digest is not None
+            and load_catalog_manifest().get('standardized') == descriptions_digest):
+        print("✓ 分類標準化資料已是最新，跳過 (catalog_standardized.json)")
+        return True
+    
     try:
         import standardize_categories
-        standardize_categories.standardize_data()
+        standardize_categories.standardize_data(DESCRIPTIONS_JSON, STANDARDIZED_JSON)
+        refresh_present_files()
+        update_catalog_manifest(standardized=descriptions_digest)
         print("✓ 分類標準化完成 (catalog_standardized.json)")
         return True
     except Exception as e:
@@ -139,14 +336,14 @@ def run_step_2_context_collector():
     print("="*60)
     
     # Check if profile exists
-    profile_exists = os.path.exists('user_profile.json')
+    profile_exists = file_exists(USER_PROFILE_JSON.name)
     
     # Step 2a: User Profile
     print("\n[2a] 使用者檔案管理...")
     try:
         from user_profile_manager import UserProfileManager
         
-        manager = UserProfileManager()
+        manager = UserProfileManager(profile_path=str(USER_PROFILE_JSON))
         
         if profile_exists:
             profile = manager.load_profile()
@@ -159,6 +356,7 @@ def run_step_2_context_collector():
             if response == 'y':
                 profile = manager.run_first_time_setup()
                 manager.save_profile(profile)
+                refresh_present_files()
                 print("✓ 使用者檔案建立完成")
             else:
                 print("⚠️  跳過使用者檔案建立")
@@ -181,7 +379,8 @@ def run_step_2_context_collector():
         context = agent.collect_complete_context(ask_questions=True)
         
         # Save context
-        agent.save_context(context, "daily_context.json")
+        agent.save_context(context, str(DAILY_CONTEXT_JSON))
+        refresh_present_files()
         print("✓ 情境資訊收集完成")
         
         return context
@@ -189,10 +388,9 @@ def run_step_2_context_collector():
         print(f"✗ 情境收集失敗: {e}")
         
         # Try to load existing context
-        if os.path.exists('daily_context.json'):
+        if file_exists(DAILY_CONTEXT_JSON.name):
             print("\n載入現有的每日情境資訊...")
-            with open('daily_context.json', 'r', encoding='utf-8') as f:
-                context = json.load(f)
+            context = load_json_cached(str(DAILY_CONTEXT_JSON))
             return context
         else:
             return None
@@ -214,7 +412,7 @@ def run_step_3_outfit_planner(context: Dict):
         from outfit_planner import OutfitPlanner
         
         print("\n初始化穿搭推薦系統...")
-        planner = OutfitPlanner()
+        planner = OutfitPlanner(embeddings=load_embeddings())
         
         if context:
             print("\n根據收集的情境資訊進行推薦...")
@@ -256,17 +454,47 @@ def run_step_3_outfit_planner(context: Dict):
         
     except Exception as e:
         print(f"✗ 穿搭推薦失敗: {e}")
-        import traceback
-        traceback.print_exc()
+        print_traceback()
         return None
 
 
-def run_complete_pipeline(skip_user_input: bool = False):
+def serve():
+    """
+    Server mode: load the outfit planner once and answer contexts read from stdin.
+    
+    Each input line is one context JSON object (same shape as daily_context.json);
+    each output line is the compact recommendation JSON. Keeping one process alive
+    amortizes the embedding load and model initialization across requests.
+    Progress messages are sent to stderr so stdout carries only results.
+    """
+    out = sys.stdout.buffer
+    with contextlib.redirect_stdout(sys.stderr):
+        from outfit_planner import OutfitPlanner
+        planner = OutfitPlanner(embeddings=load_embeddings())
+        planner.warmup()
+        print("✓ 穿搭推薦系統已就緒，等待 stdin 輸入 (每行一個情境 JSON)")
+        
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                context = loads_json(line)
+                result = planner.recommend_complete_outfit(context)
+            except Exception as e:
+                print(f"✗ 穿搭推薦失敗: {e}")
+                result = {'error': str(e)}
+            out.write(dumps_json_bytes(result, indent=False) + b"\n")
+            out.flush()
+
+
+def run_complete_pipeline(skip_user_input: bool = False, parallel: bool = False):
     """
     Run the complete pipeline from step 1 to step 3.
     
     Args:
         skip_user_input: If True, skip user input and use defaults
+        parallel: Run Step 1a and 1b concurrently (needs memory for both models)
     """
     print("\n" + "="*70)
     print("🎯 智能衣櫥推薦系統 - 完整管道")
@@ -282,15 +510,11 @@ def run_complete_pipeline(skip_user_input: bool = False):
         return False
     
     # Step 1: Catalog Builder
-    if not run_step_1_catalog_builder():
+    if not run_step_1_catalog_builder(parallel=parallel):
         print("\n✗ 步驟 1 失敗")
         return False
     # After Step 1: run category standardization to normalize categories
-    try:
-        run_standardize_categories()
-    except Exception:
-        # non-fatal: continue pipeline even if standardization fails
-        print("⚠️  分類標準化步驟發生錯誤，將繼續執行後續步驟")
+    ensure_standardized()
     
     # Step 2: Context Collector
     if skip_user_input:
@@ -315,8 +539,10 @@ def run_complete_pipeline(skip_user_input: bool = False):
     return True
 
 
-def main():
-    """Main entry point."""
+def build_arg_parser():
+    """Full argparse parser; only built for --help, '--step=N' style or invalid arguments."""
+    import argparse
+    
     parser = argparse.ArgumentParser(
         description="智能衣櫥推薦系統 - 完整管道",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -327,6 +553,7 @@ def main():
   python main_pipeline.py --step 1     # 只執行第 1 步
   python main_pipeline.py --step 2     # 只執行第 2 步
   python main_pipeline.py --step 3     # 只執行第 3 步
+  python main_pipeline.py --serve < contexts.jsonl  # 常駐模式 (模型只載入一次)
         """
     )
     
@@ -341,37 +568,93 @@ def main():
         action='store_true',
         help='快速模式：跳過用戶輸入，使用預設值'
     )
+    parser.add_argument(
+        '--parallel',
+        action='store_true',
+        help='同時執行第 1 步的 embeddings 與文字描述生成 (需足夠 GPU 記憶體同時載入 CLIP 與 LLaVA)'
+    )
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help='常駐模式：只載入一次推薦模型，從 stdin 逐行讀取情境 JSON 並輸出推薦結果'
+    )
+    parser.add_argument(
+        '--verbose',
+        action='store_true',
+        help='發生錯誤時顯示完整 traceback'
+    )
+    return parser
+
+
+# Boolean flags understood by the fast path in parse_args
+_CLI_FLAGS = {
+    '--quick': 'quick', '--parallel': 'parallel', '--serve': 'serve', '--verbose': 'verbose'
+}
+
+
+def parse_args(argv: Optional[list] = None):
+    """
+    Parse command-line arguments without importing argparse in the common case.
+    Anything outside the plain flag set (help, unknown or malformed arguments)
+    is handed to the argparse parser so help text and error messages stay the same.
     
-    args = parser.parse_args()
+    Args:
+        argv: Argument list (defaults to sys.argv[1:])
+        
+    Returns:
+        Namespace with step, quick, parallel, serve and verbose attributes
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    args = SimpleNamespace(step=None, quick=False, parallel=False, serve=False, verbose=False)
+    
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in _CLI_FLAGS:
+            setattr(args, _CLI_FLAGS[arg], True)
+        elif arg == '--step' and i + 1 < len(argv) and argv[i + 1] in ('1', '2', '3'):
+            args.step = int(argv[i + 1])
+            i += 1
+        else:
+            return build_arg_parser().parse_args(argv)
+        i += 1
+    return args
+
+
+def main():
+    """Main entry point."""
+    global VERBOSE
+    args = parse_args()
+    VERBOSE = args.verbose
     
     try:
-        if args.step:
+        if args.serve:
+            serve()
+        elif args.step:
             # Run specific step
             if args.step == 1:
-                run_step_1_catalog_builder()
+                run_step_1_catalog_builder(parallel=args.parallel)
                 # run standardization after step 1 for better downstream matching
-                run_standardize_categories()
+                ensure_standardized()
             elif args.step == 2:
                 context = run_step_2_context_collector()
             elif args.step == 3:
                 # For step 3, try to load existing context
-                if os.path.exists('daily_context.json'):
-                    with open('daily_context.json', 'r', encoding='utf-8') as f:
-                        context = json.load(f)
+                if file_exists(DAILY_CONTEXT_JSON.name):
+                    context = load_json_cached(str(DAILY_CONTEXT_JSON))
                 else:
                     context = None
                 run_step_3_outfit_planner(context)
         else:
             # Run complete pipeline
-            run_complete_pipeline(skip_user_input=args.quick)
+            run_complete_pipeline(skip_user_input=args.quick, parallel=args.parallel)
     
     except KeyboardInterrupt:
         print("\n\n⚠️  使用者中斷執行")
         sys.exit(1)
     except Exception as e:
         print(f"\n✗ 發生錯誤: {e}")
-        import traceback
-        traceback.print_exc()
+        print_traceback()
         sys.exit(1)
 
 
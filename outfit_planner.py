@@ -5,12 +5,194 @@ Uses CLIP embeddings for compatibility matching and descriptions for filtering.
 """
 
 import os
-import json
+import re
+import math
 import numpy as np
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
 from datetime import datetime
 
+from json_utils import load_json, save_json
+from score_kernels import dot_scores, warmup_dot_scores
+
+try:
+    import faiss
+    HAS_FAISS = True
+except ImportError:
+    HAS_FAISS = False
+
+try:
+    import ahocorasick
+    HAS_AHOCORASICK = True
+except ImportError:
+    HAS_AHOCORASICK = False
+
+
+# In-memory embedding precision; similarity scores are accumulated in float32.
+# Rounding unit rows to float16 shifts cosine scores by at most ~1e-3 (3.3e-4 measured
+# on the current catalog), so candidates scoring within that of each other may swap
+# order relative to float32 rows
+EMBEDDING_DTYPE = np.float16
+
+# Description fields kept as lower-cased string columns (SoA) for vectorized filtering
+CATALOG_TEXT_COLUMNS = (
+    'material', 'fit_silhouette', 'sleeve_length', 'style_aesthetic',
+    'category', 'subcategory', 'color_primary', 'color_secondary'
+)
+
+# Default recommendations for seasonal colors (lower-cased, built once)
+SEASONAL_COLORS = {
+    season: frozenset(color.lower() for color in colors)
+    for season, colors in {
+        'spring': ['pastel pink', 'soft green', 'light blue', 'cream'],
+        'summer': ['white', 'light blue', 'bright colors', 'pastels'],
+        'autumn': ['brown', 'orange', 'rust', 'gold'],
+        'winter': ['black', 'white', 'navy', 'burgundy', 'gray'],
+        'cool': ['cool gray', 'navy', 'white', 'soft pink', 'powder blue'],
+        'warm': ['warm beige', 'orange', 'gold', 'warm brown']
+    }.items()
+}
+
+# Keywords the temperature and occasion filters look for, per description field
+FILTER_KEYWORDS = {
+    'material': ('wool', 'cotton', 'linen', 'silk', 'down'),
+    'fit_silhouette': ('jacket',),
+    'sleeve_length': ('short', 'sleeveless'),
+    'style_aesthetic': ('classic', 'formal', 'business', 'sporty', 'athletic'),
+    'category': ('dress',),
+    'subcategory': ('jacket', 'athletic'),
+}
+
+# Color fields matched by whole words rather than raw substrings
+COLOR_COLUMNS = ('color_primary', 'color_secondary')
+_COLOR_TOKEN_PATTERN = re.compile(r'\w+')
+
+# Candidate sets at least this large are searched through the FAISS index;
+# smaller ones are cheaper to gather and score directly
+FAISS_MIN_CANDIDATES = 1024
+
+# Upper bound on memoized (field, term) substring masks; filter terms are a small fixed set
+TERM_MASK_CACHE_SIZE = 1024
+
+# Upper bound on memoized whole-filter masks, keyed by the filter arguments that matter
+FILTER_MASK_CACHE_SIZE = 128
+
+# Catalogs larger than this use a compressed IVF index (8-bit scalar quantization,
+# 1 byte per dimension) that probes FAISS_NPROBE inverted lists per query
+FAISS_IVF_THRESHOLD = 50_000
+FAISS_NPROBE = 16
+# Trained IVF indexes are saved beside the embeddings file with this suffix
+FAISS_IVF_SUFFIX = '.ivf.faiss'
+
+
+
+# Occasion filter, one row-mask builder per formality level (dispatched once per call)
+def _formal_mask(planner) -> np.ndarray:
+    """Formal events: prefer classic, formal styles."""
+    return planner._contains_any('style_aesthetic', ('classic', 'formal')) | planner._term_mask('category', 'dress')
+
+
+def _business_formal_mask(planner) -> np.ndarray:
+    """Business formal: prefer business-appropriate styles."""
+    return (planner._contains_any('style_aesthetic', ('business', 'classic', 'formal')) |
+            planner._term_mask('subcategory', 'jacket') | planner._term_mask('category', 'dress'))
+
+
+def _business_casual_mask(planner) -> np.ndarray:
+    """Business casual: moderate formality."""
+    return ~planner._contains_any('style_aesthetic', ('sporty', 'athletic'))
+
+
+def _casual_mask(planner) -> np.ndarray:
+    """Casual: most styles acceptable."""
+    return np.ones(len(planner.columns['filenames']), dtype=bool)
+
+
+def _sporty_mask(planner) -> np.ndarray:
+    """Sporty: prefer athletic/sporty styles."""
+    return planner._term_mask('style_aesthetic', 'sporty') | planner._term_mask('subcategory', 'athletic')
+
+
+_FORMALITY_MASKS = {
+    'formal': _formal_mask,
+    'business_formal': _business_formal_mask,
+    'business_casual': _business_casual_mask,
+    'casual': _casual_mask,
+    'sporty': _sporty_mask,
+}
+
+def build_catalog_columns(descriptions: Dict, catalog_index: Dict) -> Dict[str, np.ndarray]:
+    """
+    Convert per-outfit description dicts into columnar arrays.
+    
+    Args:
+        descriptions: Outfit descriptions keyed by filename
+        catalog_index: Catalog index keyed by filename
+        
+    Returns:
+        Dictionary of equal-length arrays: filenames, embedding_index and one
+        lower-cased string array per field in CATALOG_TEXT_COLUMNS
+    """
+    filenames = list(descriptions.keys())
+    columns = {
+        'filenames': np.array(filenames, dtype=str),
+        'embedding_index': np.array(
+            [catalog_index.get(name, {}).get('embedding_index', -1) for name in filenames],
+            dtype=np.int32
+        )
+    }
+    for field in CATALOG_TEXT_COLUMNS:
+        columns[field] = np.array(
+            [(descriptions[name].get(field, '') or '').lower() for name in filenames],
+            dtype=str
+        )
+    return columns
+
+
+def save_catalog_columns(
+    descriptions_path: str = "outfit_descriptions.json",
+    catalog_index_path: str = "catalog_index.json",
+    output_path: str = "catalog_columns.npz"
+):
+    """
+    Write the columnar catalog (catalog_columns.npz) from the Step 1 outputs.
+    
+    Args:
+        descriptions_path: Path to outfit descriptions JSON
+        catalog_index_path: Path to catalog index JSON
+        output_path: Path to save the .npz file
+    """
+    descriptions = load_json(descriptions_path)
+    catalog_index = load_json(catalog_index_path)
+    
+    np.savez(output_path, **build_catalog_columns(descriptions, catalog_index))
+
+
+def normalize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Return embeddings as float16 with unit-length rows, so cosine similarity is a
+    dot product and every scan reads half the bytes of float32 (scores within
+    ~1e-3 of float32, see EMBEDDING_DTYPE). Arrays that are
+    already in that form (as written by generate_clip_embeddings) are returned
+    unchanged, which keeps memory-mapped files mapped.
+    
+    Args:
+        embeddings: (N, D) embedding matrix
+        
+    Returns:
+        Row-normalized, C-contiguous float16 embeddings
+    """
+    # same_kind casting: float16 is read as is, float64/int inputs are narrowed to float32
+    norms = np.sqrt(np.einsum('ij,ij->i', embeddings, embeddings, dtype=np.float32, casting='same_kind'))[:, None]
+    normalized = np.allclose(norms, 1.0, atol=1e-2)
+    if normalized and embeddings.dtype == EMBEDDING_DTYPE and embeddings.flags.c_contiguous:
+        return embeddings
+    
+    if normalized:
+        return np.ascontiguousarray(embeddings, dtype=EMBEDDING_DTYPE)
+    norms[norms == 0] = 1e-10
+    return (np.asarray(embeddings, dtype=np.float32) / norms).astype(EMBEDDING_DTYPE)
+
 
 class OutfitPlanner:
     """
@@ -21,7 +203,10 @@ class OutfitPlanner:
         self,
         descriptions_path: str = "outfit_descriptions.json",
         embeddings_path: str = "outfit_embeddings.npy",
-        catalog_index_path: str = "catalog_index.json"
+        catalog_index_path: str = "catalog_index.json",
+        embeddings: Optional[np.ndarray] = None,
+        catalog_columns_path: str = "catalog_columns.npz",
+        use_cuda: bool = False
     ):
         """
         Initialize the Outfit Planner.
@@ -30,15 +215,38 @@ class OutfitPlanner:
             descriptions_path: Path to outfit descriptions JSON
             embeddings_path: Path to outfit embeddings numpy file
             catalog_index_path: Path to catalog index JSON
+            embeddings: Preloaded (e.g. memory-mapped) embeddings; skips loading embeddings_path
+            catalog_columns_path: Path to the columnar catalog written by Step 1
+            use_cuda: Keep a copy of the embeddings on the GPU for batched scoring
+                      (needs torch with CUDA; ignored otherwise)
         """
         self.descriptions_path = descriptions_path
         self.embeddings_path = embeddings_path
         self.catalog_index_path = catalog_index_path
+        self.catalog_columns_path = catalog_columns_path
         
         # Load data
         self.descriptions = self._load_descriptions()
-        self.embeddings = self._load_embeddings()
+        if embeddings is not None:
+            print(f"✓ Using preloaded embeddings with shape: {embeddings.shape}")
+        else:
+            embeddings = self._load_embeddings()
+        # Unit-length, C-contiguous rows (no copy if already so): every similarity
+        # below is a plain inner product over contiguous memory
+        self.embeddings = np.ascontiguousarray(normalize_embeddings(embeddings))
+        self.emb_t = self._embeddings_to_device() if use_cuda else None
         self.catalog_index = self._load_catalog_index()
+        self.columns = self._load_catalog_columns()
+        self._vocab, self._codes = self._encode_columns()
+        self._color_tokens = {
+            field: [frozenset(_COLOR_TOKEN_PATTERN.findall(value)) for value in self._vocab[field]]
+            for field in COLOR_COLUMNS
+        }
+        self._term_masks = self._scan_filter_keywords()
+        self._filter_masks = {}
+        # FAISS index, built on the first search with enough candidates to use it
+        self._index = None
+        self._index_built = False
         
         # Validate data
         self._validate_data()
@@ -48,32 +256,271 @@ class OutfitPlanner:
         if not os.path.exists(self.descriptions_path):
             raise FileNotFoundError(f"Descriptions file not found: {self.descriptions_path}")
         
-        with open(self.descriptions_path, 'r', encoding='utf-8') as f:
-            descriptions = json.load(f)
+        descriptions = load_json(self.descriptions_path)
         
         print(f"✓ Loaded {len(descriptions)} outfit descriptions")
         return descriptions
     
     def _load_embeddings(self) -> np.ndarray:
-        """Load outfit embeddings from numpy file."""
+        """Open outfit embeddings from numpy file (read-only memory map)."""
         if not os.path.exists(self.embeddings_path):
             raise FileNotFoundError(f"Embeddings file not found: {self.embeddings_path}")
         
-        embeddings = np.load(self.embeddings_path)
+        # Memory-mapped: rows are paged in on demand. normalize_embeddings keeps the
+        # map when the file is already unit-normalized float16 and copies only otherwise
+        embeddings = np.load(self.embeddings_path, mmap_mode='r')
         print(f"✓ Loaded embeddings with shape: {embeddings.shape}")
         return embeddings
     
+    def _embeddings_to_device(self):
+        """Copy the normalized embeddings to the GPU once (None without torch/CUDA)."""
+        # Imported here so planners without use_cuda never pay for loading torch
+        try:
+            import torch
+        except ImportError:
+            torch = None
+        if torch is None or not torch.cuda.is_available():
+            print("⚠️  CUDA not available, batched scoring stays on the CPU")
+            return None
+        
+        # np.array copies out of the read-only memory map; torch needs writable memory
+        emb_t = torch.from_numpy(np.array(self.embeddings)).pin_memory().to('cuda', non_blocking=True)
+        print(f"✓ Copied embeddings to GPU: {tuple(emb_t.shape)}")
+        return emb_t
+    
     def _load_catalog_index(self) -> Dict:
         """Load catalog index from JSON file."""
         if not os.path.exists(self.catalog_index_path):
             raise FileNotFoundError(f"Catalog index not found: {self.catalog_index_path}")
         
-        with open(self.catalog_index_path, 'r', encoding='utf-8') as f:
-            catalog_index = json.load(f)
+        catalog_index = load_json(self.catalog_index_path)
+        
+        # Flat lookups: filename -> position, position -> embedding row (int64)
+        self.fn_to_idx = {filename: i for i, filename in enumerate(catalog_index)}
+        self._emb_idx = np.fromiter(
+            (entry['embedding_index'] for entry in catalog_index.values()),
+            dtype=np.int64, count=len(catalog_index)
+        )
+        
+        # Reverse lookup for search results: embedding row -> filename
+        size = int(self._emb_idx.max()) + 1 if len(self._emb_idx) else 0
+        self.idx_to_filename = [None] * size
+        for filename, row in zip(catalog_index, self._emb_idx.tolist()):
+            self.idx_to_filename[row] = filename
         
         print(f"✓ Loaded catalog index with {len(catalog_index)} items")
         return catalog_index
     
+    @property
+    def index(self):
+        """FAISS index over the normalized embeddings, built on first access (None without faiss)."""
+        if not self._index_built:
+            self._index = self._build_index()
+            self._index_built = True
+        return self._index
+    
+    def _ivf_index_path(self) -> Optional[str]:
+        """File the trained IVF index is persisted to, beside the embeddings .npy (None if there is none)."""
+        if not os.path.exists(self.embeddings_path):
+            return None
+        return os.path.splitext(self.embeddings_path)[0] + FAISS_IVF_SUFFIX
+    
+    def _load_ivf_index(self, path: Optional[str]):
+        """Read a persisted IVF index if it is newer than the embeddings and matches their shape."""
+        if path is None or not os.path.exists(path):
+            return None
+        if os.path.getmtime(path) < os.path.getmtime(self.embeddings_path):
+            return None
+        try:
+            index = faiss.read_index(path)
+        except RuntimeError:
+            return None
+        if (index.ntotal, index.d) != self.embeddings.shape:
+            return None
+        index.nprobe = FAISS_NPROBE
+        print(f"✓ Loaded FAISS IVF index with {index.ntotal} vectors from {path}")
+        return index
+    
+    def _build_index(self):
+        """
+        Inner-product FAISS index over the normalized embeddings (None without faiss).
+        Flat fp16 index for normal catalogs; IVF + SQ8 above FAISS_IVF_THRESHOLD
+        to keep the index at a quarter of the float32 size. The IVF index needs a
+        k-means training pass, so it is written beside the embeddings and reused
+        until the embeddings file changes.
+        """
+        if not HAS_FAISS or self.embeddings.ndim != 2 or len(self.embeddings) == 0:
+            return None
+        
+        n, d = self.embeddings.shape
+        if n > FAISS_IVF_THRESHOLD:
+            path = self._ivf_index_path()
+            index = self._load_ivf_index(path)
+            if index is not None:
+                return index
+            
+            vectors = np.ascontiguousarray(self.embeddings, dtype=np.float32)
+            nlist = int(4 * math.sqrt(n))
+            index = faiss.index_factory(d, f"IVF{nlist},SQ8", faiss.METRIC_INNER_PRODUCT)
+            index.train(vectors)
+            index.add(vectors)
+            index.nprobe = FAISS_NPROBE
+            print(f"✓ Built FAISS IVF{nlist},SQ8 index with {index.ntotal} vectors")
+            if path is not None:
+                # Write then rename, so concurrent planners never read a partial file
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                faiss.write_index(index, tmp_path)
+                os.replace(tmp_path, path)
+            return index
+        
+        # Exact search over fp16 codes, matching the in-memory precision
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+        index.add(np.ascontiguousarray(self.embeddings, dtype=np.float32))
+        print(f"✓ Built FAISS index with {index.ntotal} vectors")
+        return index
+    
+    def _search_params(self, ids: np.ndarray):
+        """FAISS search parameters restricting results to the given embedding rows."""
+        selector = faiss.IDSelectorBatch(ids)
+        if self.embeddings.shape[0] > FAISS_IVF_THRESHOLD:
+            return faiss.SearchParametersIVF(sel=selector, nprobe=FAISS_NPROBE)
+        return faiss.SearchParameters(sel=selector)
+    
+    def _load_catalog_columns(self) -> Dict[str, np.ndarray]:
+        """
+        Load the columnar catalog, rebuilding it in memory from the descriptions
+        when the .npz is missing or older than the JSON it was derived from.
+        """
+        path = self.catalog_columns_path
+        if os.path.exists(path):
+            columns_mtime = os.path.getmtime(path)
+            if (columns_mtime >= os.path.getmtime(self.descriptions_path)
+                    and columns_mtime >= os.path.getmtime(self.catalog_index_path)):
+                with np.load(path) as data:
+                    columns = {name: data[name] for name in data.files}
+                if len(columns.get('filenames', ())) == len(self.descriptions):
+                    print(f"✓ Loaded catalog columns for {len(columns['filenames'])} items")
+                    return columns
+        
+        return build_catalog_columns(self.descriptions, self.catalog_index)
+    
+    def _encode_columns(self) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+        """
+        Dictionary-encode the text columns: each field becomes its sorted distinct
+        values (vocab) plus one small integer code per outfit.
+        """
+        vocab, codes = {}, {}
+        for field in CATALOG_TEXT_COLUMNS:
+            values, inverse = np.unique(self.columns[field], return_inverse=True)
+            vocab[field] = values
+            codes[field] = inverse.astype(np.int32 if len(values) > np.iinfo(np.int16).max else np.int16)
+        return vocab, codes
+    
+    def _scan_filter_keywords(self) -> Dict[Tuple[str, str], np.ndarray]:
+        """
+        Precompute the row mask of every FILTER_KEYWORDS term in one pass per
+        distinct field value. With pyahocorasick installed all keywords of a field
+        are found by a single automaton scan; otherwise each is tested with `in`.
+        
+        Returns:
+            (field, keyword) -> row mask, used to seed the _term_mask cache
+        """
+        masks = {}
+        for field, keywords in FILTER_KEYWORDS.items():
+            vocab = self._vocab[field]
+            if HAS_AHOCORASICK:
+                automaton = ahocorasick.Automaton()
+                for keyword in keywords:
+                    automaton.add_word(keyword, keyword)
+                automaton.make_automaton()
+                found = [{keyword for _, keyword in automaton.iter(str(value))} for value in vocab]
+            else:
+                found = [{keyword for keyword in keywords if keyword in value} for value in vocab]
+            
+            for keyword in keywords:
+                vocab_hits = np.fromiter((keyword in hits for hits in found), dtype=bool, count=len(vocab))
+                masks[(field, keyword)] = vocab_hits[self._codes[field]]
+        return masks
+    
+    def _term_mask(self, field: str, term: str) -> np.ndarray:
+        """
+        Rows whose lower-cased `field` column contains `term`.
+        The substring test runs over the field's distinct values only and is
+        gathered back to rows through the codes. Memoized per (field, term):
+        the filters test the same terms on every recommendation.
+        """
+        key = (field, term)
+        mask = self._term_masks.get(key)
+        if mask is None:
+            vocab_hits = np.char.find(self._vocab[field], term) >= 0
+            mask = vocab_hits[self._codes[field]]
+            if len(self._term_masks) < TERM_MASK_CACHE_SIZE:
+                self._term_masks[key] = mask
+        return mask
+    
+    def _color_mask_for(self, field: str, color: str) -> np.ndarray:
+        """
+        Rows whose color `field` contains every word of `color` ('light blue'
+        matches 'light blue' and 'white/light blue' but not 'blue'). Each distinct
+        color value is tokenized once at load, so this is a set-subset probe per
+        value instead of a substring scan. Colors without any word characters
+        fall back to the substring test. Memoized like _term_mask.
+        """
+        key = ('tokens', field, color)
+        mask = self._term_masks.get(key)
+        if mask is None:
+            wanted = frozenset(_COLOR_TOKEN_PATTERN.findall(color))
+            if not wanted:
+                # The empty set is a subset of every row: never let it match the whole catalog
+                return self._term_mask(field, color)
+            vocab_hits = np.fromiter(
+                (wanted <= tokens for tokens in self._color_tokens[field]),
+                dtype=bool, count=len(self._color_tokens[field])
+            )
+            mask = vocab_hits[self._codes[field]]
+            if len(self._term_masks) < TERM_MASK_CACHE_SIZE:
+                self._term_masks[key] = mask
+        return mask
+    
+    def _contains_any(self, field: str, terms) -> np.ndarray:
+        """Boolean mask of rows whose `field` contains any of the terms."""
+        mask = np.zeros(len(self.columns['filenames']), dtype=bool)
+        for term in terms:
+            mask |= self._term_mask(field, term)
+        return mask
+    
+    def _remember_mask(self, key: Tuple, mask: np.ndarray) -> np.ndarray:
+        """
+        Memoize a filter mask. Repeated recommendations (e.g. planning a week)
+        reuse the same comfort levels, formalities and palettes; the stored
+        mask is made read-only since it is shared between calls.
+        """
+        mask.flags.writeable = False
+        if len(self._filter_masks) < FILTER_MASK_CACHE_SIZE:
+            self._filter_masks[key] = mask
+        return mask
+    
+    def _select(self, mask: np.ndarray) -> List[str]:
+        """Filenames for a row mask, falling back to every outfit when nothing matches."""
+        return self._filenames(self._or_all(mask))
+    
+    @staticmethod
+    def _or_all(mask: np.ndarray) -> np.ndarray:
+        """A filter that matches nothing keeps every outfit instead."""
+        return mask if mask.any() else np.ones_like(mask)
+    
+    def _filenames(self, mask: np.ndarray) -> List[str]:
+        """Filenames of the rows selected by a mask, in catalog order."""
+        return self.columns['filenames'][mask].tolist()
+    
+    def warmup(self):
+        """
+        Compile the similarity kernel ahead of the first recommendation,
+        so the numba JIT cost is not paid on a user request.
+        """
+        dim = self.embeddings.shape[1] if self.embeddings.ndim == 2 else 1
+        warmup_dot_scores(dim)
+    
     def _validate_data(self):
         """Validate that all data sources are consistent."""
         descriptions_count = len(self.descriptions)
@@ -99,41 +546,39 @@ class OutfitPlanner:
         Returns:
             List of suitable outfit filenames
         """
+        return self._select(self._temperature_mask(temperature, comfort_analysis))
+    
+    def _temperature_mask(self, temperature: float, comfort_analysis: Dict) -> np.ndarray:
+        """Row mask of outfits passing the temperature filter (no empty-result fallback)."""
         comfort_level = comfort_analysis.get('comfort_level', 'comfortable')
         layers_needed = comfort_analysis.get('layers_needed', 'light')
         
-        suitable_outfits = []
+        key = ('temperature', comfort_level, layers_needed)
+        if key in self._filter_masks:
+            return self._filter_masks[key]
         
-        for filename, desc in self.descriptions.items():
-            material = desc.get('material', '').lower()
-            fit = desc.get('fit_silhouette', '').lower()
-            length = desc.get('length', '').lower()
-            sleeve = desc.get('sleeve_length', '').lower()
-            
-            # Cold weather: prefer heavy materials, layers, long sleeves
-            if comfort_level == 'cold':
-                if layers_needed == 'heavy':
-                    if 'wool' in material or 'cotton' in material or 'jacket' in fit.lower():
-                        suitable_outfits.append(filename)
-                elif layers_needed == 'medium':
-                    if 'cotton' in material or 'wool' in material:
-                        suitable_outfits.append(filename)
-            
-            # Comfortable weather: flexible options
-            elif comfort_level == 'comfortable':
-                suitable_outfits.append(filename)
-            
-            # Warm/Hot weather: prefer light materials, short sleeves
-            elif comfort_level in ['warm', 'hot']:
-                if 'linen' in material or 'cotton' in material or 'silk' in material:
-                    if 'short' in sleeve or 'sleeveless' in sleeve:
-                        suitable_outfits.append(filename)
-                else:
-                    # Still include if not heavy
-                    if 'wool' not in material and 'down' not in material:
-                        suitable_outfits.append(filename)
+        mask = np.zeros(len(self.columns['filenames']), dtype=bool)
+        
+        # Cold weather: prefer heavy materials, layers, long sleeves
+        if comfort_level == 'cold':
+            if layers_needed == 'heavy':
+                mask = self._contains_any('material', ('wool', 'cotton')) | self._term_mask('fit_silhouette', 'jacket')
+            elif layers_needed == 'medium':
+                mask = self._contains_any('material', ('cotton', 'wool'))
         
-        return suitable_outfits if suitable_outfits else list(self.descriptions.keys())
+        # Comfortable weather: flexible options
+        elif comfort_level == 'comfortable':
+            mask[:] = True
+        
+        # Warm/Hot weather: prefer light materials, short sleeves
+        elif comfort_level in ['warm', 'hot']:
+            light = self._contains_any('material', ('linen', 'cotton', 'silk'))
+            short_sleeve = self._contains_any('sleeve_length', ('short', 'sleeveless'))
+            # Still include if not heavy
+            not_heavy = ~self._contains_any('material', ('wool', 'down'))
+            mask = (light & short_sleeve) | (~light & not_heavy)
+        
+        return self._remember_mask(key, mask)
     
     def filter_by_occasion_formality(self, formality: str, occasion: str) -> List[str]:
         """
@@ -146,39 +591,21 @@ class OutfitPlanner:
         Returns:
             List of suitable outfit filenames
         """
-        suitable_outfits = []
+        return self._select(self._occasion_mask(formality, occasion))
+    
+    def _occasion_mask(self, formality: str, occasion: str) -> np.ndarray:
+        """Row mask of outfits passing the occasion/formality filter (no empty-result fallback)."""
+        key = ('occasion', formality)
+        if key in self._filter_masks:
+            return self._filter_masks[key]
         
-        for filename, desc in self.descriptions.items():
-            style = (desc.get('style_aesthetic', '') or '').lower()
-            category = (desc.get('category', '') or '').lower()
-            subcategory = (desc.get('subcategory', '') or '').lower()
-            
-            # Formal events: prefer classic, formal styles
-            if formality == 'formal':
-                if 'classic' in style or 'formal' in style or 'dress' in category:
-                    suitable_outfits.append(filename)
-            
-            # Business formal: prefer business-appropriate styles
-            elif formality == 'business_formal':
-                if ('business' in style or 'classic' in style or 'formal' in style or
-                    'jacket' in subcategory or 'dress' in category):
-                    suitable_outfits.append(filename)
-            
-            # Business casual: moderate formality
-            elif formality == 'business_casual':
-                if not ('sporty' in style or 'athletic' in style):
-                    suitable_outfits.append(filename)
-            
-            # Casual: most styles acceptable
-            elif formality == 'casual':
-                suitable_outfits.append(filename)
-            
-            # Sporty: prefer athletic/sporty styles
-            elif formality == 'sporty':
-                if 'sporty' in style or 'athletic' in subcategory:
-                    suitable_outfits.append(filename)
+        builder = _FORMALITY_MASKS.get(formality)
+        if builder is None:
+            mask = np.zeros(len(self.columns['filenames']), dtype=bool)
+        else:
+            mask = builder(self)
         
-        return suitable_outfits if suitable_outfits else list(self.descriptions.keys())
+        return self._remember_mask(key, mask)
     
     def filter_by_colors(
         self,
@@ -197,81 +624,97 @@ class OutfitPlanner:
         Returns:
             List of suitable outfit filenames
         """
-        suitable_outfits = []
-        
-        # Default recommendations for seasonal colors
-        seasonal_colors = {
-            'spring': ['pastel pink', 'soft green', 'light blue', 'cream'],
-            'summer': ['white', 'light blue', 'bright colors', 'pastels'],
-            'autumn': ['brown', 'orange', 'rust', 'gold'],
-            'winter': ['black', 'white', 'navy', 'burgundy', 'gray'],
-            'cool': ['cool gray', 'navy', 'white', 'soft pink', 'powder blue'],
-            'warm': ['warm beige', 'orange', 'gold', 'warm brown']
-        }
-        
+        return self._select(self._color_mask(preferred_colors, avoid_colors, season_type))
+    
+    def _color_mask(
+        self,
+        preferred_colors: Optional[List[str]] = None,
+        avoid_colors: Optional[List[str]] = None,
+        season_type: Optional[str] = None
+    ) -> np.ndarray:
+        """Row mask of outfits passing the color filter (no empty-result fallback)."""
         preferred = set([c.lower() for c in (preferred_colors or [])])
         avoid = set([c.lower() for c in (avoid_colors or [])])
-        seasonal = set([c.lower() for c in seasonal_colors.get(season_type or '', [])])
         
-        for filename, desc in self.descriptions.items():
-            primary = (desc.get('color_primary', '') or '').lower()
-            secondary = (desc.get('color_secondary', '') or '').lower()
-            
-            # Check if colors match preferences or seasonal palette
-            colors_match = False
-            
-            # If no preferences specified, use seasonal colors or accept all
-            if not preferred and not avoid:
-                if season_type and season_type in seasonal_colors:
-                    # Check against seasonal palette
-                    for seasonal_color in seasonal_colors[season_type]:
-                        if seasonal_color in primary or seasonal_color in secondary:
-                            colors_match = True
-                            break
-                else:
-                    # No season info, accept all
-                    colors_match = True
+        key = ('color', frozenset(preferred), frozenset(avoid), season_type)
+        if key in self._filter_masks:
+            return self._filter_masks[key]
+        
+        n = len(self.columns['filenames'])
+        
+        def color_match(colors) -> np.ndarray:
+            mask = np.zeros(n, dtype=bool)
+            for color in colors:
+                for field in COLOR_COLUMNS:
+                    mask |= self._color_mask_for(field, color)
+            return mask
+        
+        # Check if colors match preferences or seasonal palette
+        # If no preferences specified, use seasonal colors or accept all
+        if not preferred and not avoid:
+            if season_type and season_type in SEASONAL_COLORS:
+                # Check against seasonal palette
+                colors_match = color_match(SEASONAL_COLORS[season_type])
             else:
-                # Check preferred colors
-                if preferred:
-                    for pref in preferred:
-                        if pref in primary or pref in secondary:
-                            colors_match = True
-                            break
-                else:
-                    colors_match = True
-            
-            # Check avoid colors
-            avoid_match = False
-            if avoid:
-                for avoid_color in avoid:
-                    if avoid_color in primary or avoid_color in secondary:
-                        avoid_match = True
-                        break
-            
-            if colors_match and not avoid_match:
-                suitable_outfits.append(filename)
+                # No season info, accept all
+                colors_match = np.ones(n, dtype=bool)
+        else:
+            # Check preferred colors
+            colors_match = color_match(preferred) if preferred else np.ones(n, dtype=bool)
         
-        return suitable_outfits if suitable_outfits else list(self.descriptions.keys())
+        # Check avoid colors
+        avoid_match = color_match(avoid) if avoid else np.zeros(n, dtype=bool)
+        
+        return self._remember_mask(key, colors_match & ~avoid_match)
+    
+    def _fused_filter(
+        self,
+        temperature: float,
+        comfort_analysis: Dict,
+        formality: str,
+        occasion: str,
+        preferred_colors: Optional[List[str]] = None,
+        avoid_colors: Optional[List[str]] = None,
+        season_type: Optional[str] = None
+    ) -> Tuple[np.ndarray, Dict[str, int]]:
+        """
+        Apply the temperature, occasion/formality and color filters in one pass.
+        Each filter still falls back to every outfit when it matches nothing on
+        its own; the result is their intersection.
+        
+        Returns:
+            (candidate row mask, survivor counts per stage: temperature,
+            occasion, combined (temperature & occasion), color)
+        """
+        temp_mask = self._or_all(self._temperature_mask(temperature, comfort_analysis))
+        occasion_mask = self._or_all(self._occasion_mask(formality, occasion))
+        color_mask = self._or_all(self._color_mask(preferred_colors, avoid_colors, season_type))
+        
+        mask = temp_mask & occasion_mask
+        counts = {
+            'temperature': int(np.count_nonzero(temp_mask)),
+            'occasion': int(np.count_nonzero(occasion_mask)),
+            'combined': int(np.count_nonzero(mask)),
+        }
+        mask &= color_mask
+        counts['color'] = int(np.count_nonzero(mask))
+        return mask, counts
     
     def calculate_embedding_similarity(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
         """
         Calculate cosine similarity between two embeddings.
+        Rows of self.embeddings are L2-normalized at load time, so this is a dot product.
         
         Args:
-            embedding1: First embedding vector
-            embedding2: Second embedding vector
+            embedding1: First embedding vector (unit length), e.g. a row view of self.embeddings
+            embedding2: Second embedding vector (unit length)
             
         Returns:
             Similarity score between -1 and 1 (higher is more similar)
         """
-        # Normalize embeddings
-        emb1_norm = embedding1 / (np.linalg.norm(embedding1) + 1e-8)
-        emb2_norm = embedding2 / (np.linalg.norm(embedding2) + 1e-8)
-        
-        # Cosine similarity
-        similarity = np.dot(emb1_norm, emb2_norm)
-        return float(similarity)
+        # Accumulate in float32 without materializing upcast copies of the rows;
+        # same_kind casting also accepts float64 vectors and plain lists
+        return float(np.einsum('i,i->', embedding1, embedding2, dtype=np.float32, casting='same_kind'))
     
     def find_complementary_outfits(
         self,
@@ -290,31 +733,100 @@ class OutfitPlanner:
         Returns:
             List of (filename, similarity_score) tuples, sorted by similarity
         """
-        if base_outfit_filename not in self.catalog_index:
+        if base_outfit_filename not in self.fn_to_idx:
             raise ValueError(f"Outfit '{base_outfit_filename}' not in catalog")
         
-        base_idx = self.catalog_index[base_outfit_filename]['embedding_index']
-        base_embedding = self.embeddings[base_idx]
+        base_idx = self._emb_idx[self.fn_to_idx[base_outfit_filename]]
+        base_embedding = np.asarray(self.embeddings[base_idx], dtype=np.float32)
         
-        similarities = []
+        names = [
+            candidate for candidate in candidate_filenames
+            if candidate != base_outfit_filename and candidate in self.fn_to_idx
+        ]
+        if not names or top_k <= 0:
+            return []
+        # One dict lookup per candidate, then a single vectorized gather of embedding rows
+        indices = self._emb_idx[np.fromiter(
+            (self.fn_to_idx[candidate] for candidate in names),
+            dtype=np.int64, count=len(names)
+        )]
         
-        for candidate in candidate_filenames:
-            if candidate == base_outfit_filename:
-                continue
-            
-            if candidate not in self.catalog_index:
-                continue
-            
-            candidate_idx = self.catalog_index[candidate]['embedding_index']
-            candidate_embedding = self.embeddings[candidate_idx]
+        if len(names) >= FAISS_MIN_CANDIDATES and self.index is not None:
+            # Restrict the index search to the candidate rows
+            params = self._search_params(indices)
+            scores, ids = self.index.search(base_embedding[None, :], min(top_k, len(names)), params=params)
+            return [
+                (self.idx_to_filename[i], float(score))
+                for score, i in zip(scores[0], ids[0]) if i >= 0
+            ]
+        
+        # Score all candidates in one pass over a contiguous float32 gather (rows are unit length)
+        candidate_embeddings = np.ascontiguousarray(self.embeddings[indices], dtype=np.float32)
+        scores = dot_scores(candidate_embeddings, base_embedding)
+        
+        # Partial top-k selection, then order only those k (descending, ties keep input order)
+        if top_k < len(scores):
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.lexsort((top, -scores[top]))]
+        
+        return [(names[i], float(scores[i])) for i in top]
+    
+    def find_complementary_outfits_batch(
+        self,
+        base_filenames: List[str],
+        candidate_filenames: List[str],
+        top_k: int = 5
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Find complementary outfits for several base outfits against one candidate set.
+        With embeddings on the GPU (use_cuda=True) all bases are scored in a single
+        matrix product and top-k, and results are copied back once; otherwise each
+        base goes through find_complementary_outfits.
+        
+        Args:
+            base_filenames: Filenames of the base outfits
+            candidate_filenames: List of candidate outfit filenames to compare
+            top_k: Number of top matches to return per base outfit
             
-            similarity = self.calculate_embedding_similarity(base_embedding, candidate_embedding)
-            similarities.append((candidate, similarity))
+        Returns:
+            One list of (filename, similarity_score) tuples per base outfit, sorted by similarity
+        """
+        if self.emb_t is None:
+            return [self.find_complementary_outfits(base, candidate_filenames, top_k) for base in base_filenames]
+        
+        for base in base_filenames:
+            if base not in self.fn_to_idx:
+                raise ValueError(f"Outfit '{base}' not in catalog")
+        
+        names = [candidate for candidate in candidate_filenames if candidate in self.fn_to_idx]
+        if not base_filenames or not names or top_k <= 0:
+            return [[] for _ in base_filenames]
         
-        # Sort by similarity (descending)
-        similarities.sort(key=lambda x: x[1], reverse=True)
+        candidate_rows = self._emb_idx[np.fromiter(
+            (self.fn_to_idx[candidate] for candidate in names), dtype=np.int64, count=len(names)
+        )]
+        base_rows = self._emb_idx[np.fromiter(
+            (self.fn_to_idx[base] for base in base_filenames), dtype=np.int64, count=len(base_filenames)
+        )]
         
-        return similarities[:top_k]
+        import torch  # already loaded by _embeddings_to_device
+        
+        device = self.emb_t.device
+        candidate_t = torch.from_numpy(candidate_rows).to(device)
+        base_t = torch.from_numpy(base_rows).to(device)
+        with torch.inference_mode():
+            # (candidates, bases) similarity matrix; a base never matches itself
+            sims = self.emb_t[candidate_t].float() @ self.emb_t[base_t].float().T
+            sims[candidate_t[:, None] == base_t[None, :]] = float('-inf')
+            scores, top = torch.topk(sims, min(top_k, len(names)), dim=0)
+            scores, top = scores.T.cpu().numpy(), top.T.cpu().numpy()
+        
+        return [
+            [(names[i], float(score)) for score, i in zip(row_scores, row_top) if score != float('-inf')]
+            for row_scores, row_top in zip(scores, top)
+        ]
     
     def recommend_complete_outfit(self, context: Dict) -> Dict:
         """
@@ -357,21 +869,14 @@ class OutfitPlanner:
         # Apply filters in sequence
         print(f"\n🔍 正在進行穿搭篩選...")
         
-        # Filter 1: Temperature
-        temp_suitable = self.filter_by_temperature(temperature, comfort_analysis)
-        print(f"  ✓ 溫度過濾: {len(temp_suitable)} 件衣服")
-        
-        # Filter 2: Occasion and Formality
-        occasion_suitable = self.filter_by_occasion_formality(formality, occasion)
-        print(f"  ✓ 場合過濾: {len(occasion_suitable)} 件衣服")
-        
-        # Intersect first two filters
-        candidates = list(set(temp_suitable) & set(occasion_suitable))
-        print(f"  ✓ 綜合過濾: {len(candidates)} 件衣服")
-        
-        # Filter 3: Colors
-        color_suitable = self.filter_by_colors(color_pref, avoid_colors, season_type)
-        candidates = list(set(candidates) & set(color_suitable))
+        # Temperature, occasion and color filters evaluated together as one mask
+        candidate_mask, counts = self._fused_filter(
+            temperature, comfort_analysis, formality, occasion, color_pref, avoid_colors, season_type
+        )
+        candidates = self._filenames(candidate_mask)
+        print(f"  ✓ 溫度過濾: {counts['temperature']} 件衣服")
+        print(f"  ✓ 場合過濾: {counts['occasion']} 件衣服")
+        print(f"  ✓ 綜合過濾: {counts['combined']} 件衣服")
         print(f"  ✓ 色彩過濾: {len(candidates)} 件衣服")
         
         # Categorize recommendations
@@ -417,10 +922,13 @@ class OutfitPlanner:
                 upper_candidates = uppers[:top_n]
                 lower_candidates = lowers[:top_n]
 
-                for u in upper_candidates:
-                    u_fname = u['filename']
-                    # find top complementary lowers for this upper
-                    comps = self.find_complementary_outfits(u_fname, [l['filename'] for l in lower_candidates], top_k=top_n)
+                # find top complementary lowers for every upper in one batched call
+                all_comps = self.find_complementary_outfits_batch(
+                    [u['filename'] for u in upper_candidates],
+                    [l['filename'] for l in lower_candidates],
+                    top_k=top_n
+                )
+                for u, comps in zip(upper_candidates, all_comps):
                     if not comps:
                         continue
                     # comps are (filename, similarity)
@@ -461,9 +969,10 @@ class OutfitPlanner:
             for sub in conflicting:
                 sub_formality = formality  # keep same formality unless more complex mapping exists
                 # re-filter by occasion-specific formality if needed (simple approach)
-                sub_temp_suitable = temp_suitable
-                sub_occasion_suitable = self.filter_by_occasion_formality(sub_formality, sub)
-                sub_candidates = list(set(sub_temp_suitable) & set(sub_occasion_suitable) & set(color_suitable))
+                sub_mask, _ = self._fused_filter(
+                    temperature, comfort_analysis, sub_formality, sub, color_pref, avoid_colors, season_type
+                )
+                sub_candidates = self._filenames(sub_mask)
                 sub_categorized = self._categorize_outfits(sub_candidates)
                 chosen = _choose_best_pair(sub_categorized)
                 multi_recommendations[sub] = chosen
@@ -603,8 +1112,7 @@ class OutfitPlanner:
             result: Recommendation result dictionary
             output_path: Path to save the JSON file
         """
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
+        save_json(result, output_path)
         print(f"\n✓ 推薦結果已儲存至: {output_path}")
 
 
@@ -0,0 +1,40 @@
+"""
+Numba kernels for the binary-relevance ranking metrics in metrics.py.
+Each kernel takes the labels as an int8 array (1=relevant, 0=not relevant).
+Importing this module raises ImportError when numba is not installed.
+"""
+
+from numba import njit
+
+
+@njit(cache=True)
+def _precision_at_k(rel, k):
+    """Relevant items among the first k labels, divided by k."""
+    hits = 0
+    for i in range(min(k, rel.shape[0])):
+        hits += rel[i]
+    return hits / k
+
+
+@njit(cache=True)
+def _mrr(rel):
+    """Reciprocal rank of the first relevant label (0.0 if there is none)."""
+    for i in range(rel.shape[0]):
+        if rel[i]:
+            return 1.0 / (i + 1)
+    return 0.0
+
+
+@njit(cache=True)
+def _map_at_k(rel, k):
+    """Precision at each relevant position of the first k labels, averaged over the cutoff length."""
+    n = min(k, rel.shape[0])
+    if n == 0:
+        return 0.0
+    hits = 0
+    total = 0.0
+    for i in range(n):
+        hits += rel[i]
+        if rel[i]:
+            total += hits / (i + 1)
+    return total / n
@@ -1,15 +1,59 @@
 import json
 import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Iterable, Iterator
 from pathlib import Path
 
+from score_kernels import dot_scores, warmup_dot_scores
+
 try:
     from sentence_transformers import SentenceTransformer
     HAS_SENTENCE_TRANSFORMERS = True
 except ImportError:
     HAS_SENTENCE_TRANSFORMERS = False
 
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import faiss
+    HAS_FAISS = True
+except ImportError:
+    HAS_FAISS = False
+
+try:
+    import simsimd as simd
+    HAS_SIMSIMD = True
+except ImportError:
+    HAS_SIMSIMD = False
+
+# Query result caches: exact query strings, plus recent query embeddings
+# matched by cosine similarity (near-duplicate phrasing reuses results)
+SEARCH_CACHE_SIZE = 128
+SEMANTIC_CACHE_THRESHOLD = 0.97
+
+# Catalogs larger than this are searched through a FAISS HNSW graph (approximate);
+# smaller ones are cheaper to scan exhaustively
+ANN_MIN_CATALOG = 50_000
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+
+# The normalized catalog is cached and memory-mapped as float16; exact scans
+# upcast it to float32 this many rows at a time to bound the temporary copy
+NORM_DTYPE = np.float16
+NORM_BLOCK_ROWS = 16_384
+
+# Metadata fields the keyword search matches against, in concatenation order
+KEYWORD_SEARCH_FIELDS = ("complete_description", "description", "color_primary", "material", "category")
+
+# Categories the hot-weather rule always excludes
+WARM_CATEGORIES = ("coat", "parka", "heavy jacket")
+
 class CatalogLoaderV2:
     """
     Enhanced catalog loader supporting Part 1 integration with hybrid search.
@@ -40,6 +84,7 @@ class CatalogLoaderV2:
         
         # 1. 定義檔案路徑 (相對於 base_path)
         self.embeddings_path = os.path.join(base_path, "outfit_embeddings.npy")
+        self.embeddings_norm_path = os.path.join(base_path, "outfit_embeddings_norm.npy")
         self.descriptions_path = os.path.join(base_path, "outfit_descriptions.json")
         self.standardized_catalog_path = os.path.join(base_path, "catalog_standardized.json")
         
@@ -54,21 +99,87 @@ class CatalogLoaderV2:
             raise FileNotFoundError(f"No catalog found in {base_path}. Expected catalog_standardized.json or outfit_descriptions.json")
             
         self.catalog_size = len(self.catalog)
+        # The catalog is read-only after load: keep positional views for search results
+        self._catalog_items = list(self.catalog.items())
+        self._catalog_values = [item_meta for _, item_meta in self._catalog_items]
+        # Column (SoA) view of the searched fields: lower-cased once, one string array per field
+        self._columns = self._build_columns(self._catalog_values)
+        self._inverted = self._build_inverted_index(
+            " ".join(parts) for parts in zip(*(self._columns[field].tolist() for field in KEYWORD_SEARCH_FIELDS))
+        )
+        self._keyword_postings = {}
+        # Per-item rule flags for filter_metadata, keyed by item identity
+        self._item_positions = {id(item_meta): i for i, item_meta in enumerate(self._catalog_values)}
+        self._is_warm_garment = (
+            (np.char.find(self._columns["material"], "wool") >= 0) |
+            (np.char.find(self._columns["description"], "thick") >= 0) |
+            np.isin(self._columns["category"], WARM_CATEGORIES)
+        )
+        
+        # 查詢快取 (exact + semantic)
+        self._query_cache = OrderedDict()
+        self._semantic_keys = None
+        self._semantic_entries = []
+        self._semantic_pos = 0
         
         # 3. 載入 Embeddings
         self.embeddings = None
+        self.embeddings_norm = None
+        self.ann_index = None
         self.embedding_model = None
         self._load_embeddings_and_model()
 
     def _load_json(self, path: str) -> Dict[str, Any]:
-        """Generic JSON loader helper."""
+        """Generic JSON loader helper (orjson when installed)."""
+        if HAS_ORJSON:
+            with open(path, 'rb') as f:
+                return orjson.loads(f.read())
         with open(path, 'r', encoding='utf-8') as f:
             return json.load(f)
 
+    @staticmethod
+    def _build_columns(items: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        """One lower-cased NumPy string array per searched metadata field."""
+        return {
+            field: np.array([str(item.get(field, "")).lower() for item in items], dtype=str)
+            for field in KEYWORD_SEARCH_FIELDS
+        }
+
+    @staticmethod
+    def _build_inverted_index(texts) -> Dict[str, np.ndarray]:
+        """Map each whitespace-delimited token to the sorted catalog positions containing it."""
+        postings: Dict[str, List[int]] = {}
+        for i, text in enumerate(texts):
+            for token in set(text.split()):
+                postings.setdefault(token, []).append(i)
+        return {token: np.array(docs, dtype=np.int32) for token, docs in postings.items()}
+
+    def _keyword_docs(self, keyword: str) -> np.ndarray:
+        """
+        Catalog positions whose searchable text contains keyword as a substring.
+        Query keywords carry no whitespace, so every match lies inside a single
+        token: scanning the token vocabulary is equivalent to scanning the texts.
+        """
+        docs = self._keyword_postings.get(keyword)
+        if docs is None:
+            hits = [postings for token, postings in self._inverted.items() if keyword in token]
+            docs = np.unique(np.concatenate(hits)) if hits else np.empty(0, dtype=np.int32)
+            if len(self._keyword_postings) >= SEARCH_CACHE_SIZE:
+                self._keyword_postings.pop(next(iter(self._keyword_postings)))
+            self._keyword_postings[keyword] = docs
+        return docs
+
+    @staticmethod
+    def _warm_garment(item: Dict[str, Any]) -> bool:
+        """True for items the hot-weather rule excludes (wool, thick, or heavy outerwear)."""
+        cat = str(item.get("category", "")).lower()
+        material = str(item.get("material", "")).lower()
+        desc = str(item.get("description", "")).lower()
+        return "wool" in material or "thick" in desc or cat in WARM_CATEGORIES
+
     def _load_descriptions(self) -> Dict[str, Dict[str, Any]]:
         """Legacy loader for outfit_descriptions.json (Part 1 raw format)."""
-        with open(self.descriptions_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = self._load_json(self.descriptions_path)
         
         # If data is a list, convert to dict keyed by filename/item_id
         if isinstance(data, list):
@@ -82,12 +193,18 @@ class CatalogLoaderV2:
             return
         
         try:
-            self.embeddings = np.load(self.embeddings_path)
+            # Memory-mapped: pages fault in on demand and are shared between processes
+            self.embeddings = np.load(self.embeddings_path, mmap_mode='r')
             print(f"Info: Loaded embeddings shape {self.embeddings.shape}")
         except Exception as e:
             print(f"Warning: Failed to load embeddings: {e}")
             return
         
+        # Normalized once for cosine similarity; queries then reduce to one dot product.
+        # Kept as the float16 memory map: half the bytes streamed per query, no in-RAM copy
+        self.embeddings_norm = self._load_normalized_embeddings()
+        self.ann_index = self._build_ann_index()
+        
         if not HAS_SENTENCE_TRANSFORMERS:
             print("Warning: sentence-transformers not installed. Using keyword-only search.")
             return
@@ -99,6 +216,58 @@ class CatalogLoaderV2:
         if self.embedding_model is None and self.auto_detect_model:
             self._auto_detect_model()
 
+    def _load_normalized_embeddings(self) -> np.ndarray:
+        """
+        Row-normalized float16 embeddings, memory-mapped from outfit_embeddings_norm.npy.
+        The file is rebuilt when missing or older than outfit_embeddings.npy; if it
+        cannot be written the normalized matrix is kept in memory instead.
+        """
+        path = self.embeddings_norm_path
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(self.embeddings_path):
+            try:
+                cached = np.load(path, mmap_mode='r')
+                if cached.shape == self.embeddings.shape and cached.dtype == NORM_DTYPE:
+                    return cached
+            except (OSError, ValueError):
+                pass
+        
+        embeddings = np.asarray(self.embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        normalized = (embeddings / np.maximum(norms, 1e-10)).astype(NORM_DTYPE)
+        # Write to a per-process temp file and rename it into place, so a loader
+        # starting concurrently never memory-maps a half-written file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, normalized)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Could not cache normalized embeddings at {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return normalized
+        return np.load(path, mmap_mode='r')
+
+    def warmup(self):
+        """
+        Compile the similarity kernel ahead of the first query, so the numba JIT
+        cost is not paid on a user request (no-op without embeddings).
+        """
+        if self.embeddings_norm is not None:
+            warmup_dot_scores(self.embeddings_norm.shape[1])
+
+    def _build_ann_index(self):
+        """Inner-product HNSW index over embeddings_norm for large catalogs (None otherwise)."""
+        if not HAS_FAISS or len(self.embeddings_norm) <= ANN_MIN_CATALOG:
+            return None
+        
+        index = faiss.IndexHNSWFlat(self.embeddings_norm.shape[1], HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        # The graph stores its own float32 copy of the vectors
+        index.add(np.asarray(self.embeddings_norm, dtype=np.float32))
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        print(f"Info: Built FAISS HNSW index with {index.ntotal} vectors")
+        return index
+
     # ... (以下的方法如 _try_load_model, search_by_text, filter_metadata 等保持不變)
     
     def _try_load_model(self, model_name: str) -> bool:
@@ -150,11 +319,51 @@ class CatalogLoaderV2:
     ) -> List[Tuple[Dict[str, Any], float]]:
         """
         Search catalog using hybrid approach: embedding-based + keyword fallback.
+        Repeated queries are answered from an LRU cache of recent results.
         """
+        key = (query, top_k, threshold)
+        cached = self._query_cache.get(key)
+        if cached is not None:
+            self._query_cache.move_to_end(key)
+            return list(cached)
+        
         if self.embedding_model is not None and self.embeddings is not None:
-            return self._search_by_embedding(query, top_k, threshold)
+            results = self._search_by_embedding(query, top_k, threshold)
         else:
-            return self._search_by_keyword(query, top_k)
+            results = self._search_by_keyword(query, top_k)
+        
+        self._query_cache[key] = results
+        if len(self._query_cache) > SEARCH_CACHE_SIZE:
+            self._query_cache.popitem(last=False)
+        return list(results)
+    
+    def _semantic_lookup(self, q: np.ndarray, top_k: int, threshold: float):
+        """Return cached results of a near-identical earlier query embedding, or None."""
+        if not self._semantic_entries:
+            return None
+        
+        sims = self._semantic_keys[:len(self._semantic_entries)] @ q
+        for slot in np.argsort(-sims):
+            if sims[slot] < SEMANTIC_CACHE_THRESHOLD:
+                break
+            entry_top_k, entry_threshold, results = self._semantic_entries[slot]
+            if entry_top_k == top_k and entry_threshold == threshold:
+                return results
+        return None
+    
+    def _semantic_store(self, q: np.ndarray, top_k: int, threshold: float, results):
+        """Remember a query embedding and its results in the fixed-size ring buffer."""
+        if self._semantic_keys is None:
+            self._semantic_keys = np.zeros((SEARCH_CACHE_SIZE, len(q)), dtype=np.float32)
+        
+        slot = self._semantic_pos
+        self._semantic_keys[slot] = q
+        entry = (top_k, threshold, results)
+        if slot < len(self._semantic_entries):
+            self._semantic_entries[slot] = entry
+        else:
+            self._semantic_entries.append(entry)
+        self._semantic_pos = (slot + 1) % SEARCH_CACHE_SIZE
     
     def _search_by_embedding(
         self,
@@ -163,33 +372,153 @@ class CatalogLoaderV2:
         threshold: float = 0.3
     ) -> List[Tuple[Dict[str, Any], float]]:
         """Semantic search using embeddings."""
-        # Encode query
-        query_emb = self.embedding_model.encode([query], convert_to_numpy=True)
-        query_emb = query_emb / (np.linalg.norm(query_emb, axis=1, keepdims=True) + 1e-10)
+        return self._search_encoded(self._encode_query(query), top_k, threshold)
+    
+    def _encode_query(self, query: str) -> np.ndarray:
+        """Encode one query into a unit-length float32 vector."""
+        q = self.embedding_model.encode([query], convert_to_numpy=True)[0].astype(np.float32, copy=False)
+        return q / (np.sqrt(np.vdot(q, q)) + 1e-10)
+    
+    def _search_encoded(
+        self,
+        q: np.ndarray,
+        top_k: int,
+        threshold: float
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """Semantic search for an already encoded, normalized query vector."""
+        cached = self._semantic_lookup(q, top_k, threshold)
+        if cached is not None:
+            return list(cached)
+        
+        if self.ann_index is not None:
+            results = self._ann_results(q[None, :], top_k, threshold)[0]
+        else:
+            results = self._top_results(self._similarities(q), top_k, threshold)
+        
+        self._semantic_store(q, top_k, threshold, results)
+        return results
+    
+    def search_stream(
+        self,
+        queries: Iterable[str],
+        top_k: int = 5,
+        threshold: float = 0.3
+    ) -> Iterator[List[Tuple[Dict[str, Any], float]]]:
+        """
+        Search a stream of queries, yielding one result list per query in order.
+        The next query is encoded on a worker thread while the current one is
+        scored (BLAS releases the GIL), hiding the model's encode latency.
+        """
+        if self.embedding_model is None or self.embeddings is None:
+            for query in queries:
+                yield self.search_by_text(query, top_k, threshold)
+            return
+        
+        pending_queries = iter(queries)
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            query = next(pending_queries, None)
+            pending = pool.submit(self._encode_query, query) if query is not None else None
+            while pending is not None:
+                q = pending.result()
+                query = next(pending_queries, None)
+                pending = pool.submit(self._encode_query, query) if query is not None else None
+                yield self._search_encoded(q, top_k, threshold)
+    
+    def batch_search(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        threshold: float = 0.3
+    ) -> List[List[Tuple[Dict[str, Any], float]]]:
+        """
+        Search several queries at once: one encode call and one matrix product
+        against the catalog instead of a round of Python dispatch per query.
+        Falls back to search_by_text per query when no embedding model is loaded.
+        """
+        if self.embedding_model is None or self.embeddings is None:
+            return [self.search_by_text(query, top_k, threshold) for query in queries]
+        if not queries:
+            return []
         
-        # Normalize embeddings for cosine similarity
-        embeddings_norm = self.embeddings / (np.linalg.norm(self.embeddings, axis=1, keepdims=True) + 1e-10)
+        Q = np.asarray(self.embedding_model.encode(list(queries), convert_to_numpy=True), dtype=np.float32)
+        Q = Q / (np.sqrt(np.einsum('ij,ij->i', Q, Q))[:, None] + 1e-10)
+        if self.ann_index is not None:
+            return self._ann_results(Q, top_k, threshold)
+        similarities = self._similarities(Q)
+        return [self._top_results(row, top_k, threshold) for row in similarities]
+    
+    def _similarities(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of normalized query vector(s) against every catalog row:
+        shape (N,) for a single 1-D query, (B, N) for a (B, D) batch.
+        """
+        if HAS_SIMSIMD:
+            # SIMD fp16 cosine kernel; cdist returns distances (1 - similarity)
+            queries_q = np.atleast_2d(queries).astype(np.float16)
+            similarities = 1.0 - np.asarray(simd.cdist(queries_q, self.embeddings_norm, metric='cosine'))
+            return similarities.ravel() if queries.ndim == 1 else similarities
         
-        # Compute similarities
-        similarities = np.dot(embeddings_norm, query_emb.T).flatten()
+        # float32 kernels over float32 blocks of the float16 catalog (rows normalized at load time)
+        n = len(self.embeddings_norm)
+        similarities = np.empty((n,) if queries.ndim == 1 else (len(queries), n), dtype=np.float32)
+        for start in range(0, n, NORM_BLOCK_ROWS):
+            block = np.asarray(self.embeddings_norm[start:start + NORM_BLOCK_ROWS], dtype=np.float32)
+            if queries.ndim == 1:
+                similarities[start:start + len(block)] = dot_scores(block, queries)
+            else:
+                # One GEMM per block for the whole batch
+                similarities[:, start:start + len(block)] = queries @ block.T
+        return similarities
+    
+    def _ann_results(
+        self,
+        queries: np.ndarray,
+        top_k: int,
+        threshold: float
+    ) -> List[List[Tuple[Dict[str, Any], float]]]:
+        """Top-k catalog items per (B, D) query row from the HNSW index, scores >= threshold."""
+        k = min(top_k, self.ann_index.ntotal)
+        if k <= 0:
+            return [[] for _ in range(len(queries))]
         
-        # Get top-k indices
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        # efSearch bounds the candidate list, so it must cover k
+        self.ann_index.hnsw.efSearch = max(HNSW_EF_SEARCH, k)
+        scores, ids = self.ann_index.search(np.ascontiguousarray(queries, dtype=np.float32), k)
+        max_idx = min(len(self._catalog_values), len(self.embeddings))
+        return [
+            [
+                (self._catalog_values[idx], score)
+                for idx, score in zip(row_ids.tolist(), row_scores.tolist())
+                if 0 <= idx < max_idx and score >= threshold
+            ]
+            for row_scores, row_ids in zip(scores, ids)
+        ]
+    
+    def _top_results(
+        self,
+        similarities: np.ndarray,
+        top_k: int,
+        threshold: float
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """Top-k catalog items of one similarity vector, keeping scores >= threshold."""
+        # Get top-k indices: O(N) partial selection, then sort only those k
+        k = min(top_k, len(similarities))
+        if k <= 0:
+            return []
+        top_indices = np.argpartition(-similarities, k - 1)[:k]
+        top_indices = top_indices[np.argsort(-similarities[top_indices])]
         
         results = []
-        catalog_items = list(self.catalog.items())
         
         # Handle case where catalog size doesn't match embeddings size
-        max_idx = min(len(catalog_items), len(self.embeddings))
+        max_idx = min(len(self._catalog_values), len(self.embeddings))
         
         for idx in top_indices:
             if idx >= max_idx: continue
             
             score = float(similarities[idx])
             if score >= threshold:
-                # catalog_items is list of (key, value)
-                item_key, item_meta = catalog_items[int(idx)]
-                results.append((item_meta, score))
+                results.append((self._catalog_values[int(idx)], score))
         
         return results
     
@@ -199,30 +528,27 @@ class CatalogLoaderV2:
         top_k: int = 5
     ) -> List[Tuple[Dict[str, Any], float]]:
         """Keyword-based fallback search."""
-        keywords = query.lower().split()
-        results = []
+        keywords = tuple(query.lower().split())
+        if not keywords:
+            return []
         
-        for item_key, item_meta in self.catalog.items():
-            score = 0
-            # Construct searchable text from metadata fields
-            text_to_search = (
-                str(item_meta.get("complete_description", "")).lower() + " " +
-                str(item_meta.get("description", "")).lower() + " " + # Added generic description field
-                str(item_meta.get("color_primary", "")).lower() + " " +
-                str(item_meta.get("material", "")).lower() + " " +
-                str(item_meta.get("category", "")).lower()
-            )
-            
-            for keyword in keywords:
-                if keyword in text_to_search:
-                    score += 1
-            
-            if score > 0:
-                normalized_score = min(score / len(keywords), 1.0) if keywords else 0.0
-                results.append((item_meta, normalized_score))
+        # Count keyword hits per item from the inverted index (built at load time)
+        scores = np.zeros(len(self._catalog_values), dtype=np.int32)
+        keyword_docs = self._keyword_docs
+        for keyword in keywords:
+            scores[keyword_docs(keyword)] += 1
+        
+        # Highest score first; ties keep catalog order. Only the returned
+        # top_k rows are converted to Python objects
+        matched = np.flatnonzero(scores)
+        matched = matched[np.argsort(-scores[matched], kind='stable')][:top_k]
         
-        results.sort(key=lambda x: x[1], reverse=True)
-        return results[:top_k]
+        values = self._catalog_values
+        n_keywords = len(keywords)
+        return [
+            (values[i], min(count / n_keywords, 1.0))
+            for i, count in zip(matched.tolist(), scores[matched].tolist())
+        ]
 
     def filter_metadata(
         self,
@@ -245,30 +571,22 @@ class CatalogLoaderV2:
             except:
                 pass
         
-        occasion = context.get("occasion", {})
-        # Occasion might be string or dict
-        occ_text = str(occasion).lower() if not isinstance(occasion, dict) else str(occasion.get("type", "")).lower()
-
-        filtered = []
-
-        for item, score in candidates:
-            cat = str(item.get("category", "")).lower()
-            material = str(item.get("material", "")).lower()
-            desc = str(item.get("description", "")).lower()
+        # 1. Swimming Rule: swim/beach occasions do not exclude non-swimwear yet (not strict)
 
-            # 1. Swimming Rule
-            if "swim" in occ_text or "beach" in occ_text:
-                # If specifically swimming, prioritize swimwear
-                if "swim" in occ_text and cat not in ["swimwear", "swimsuit", "bikini"]:
-                     # Only skip if we are strict, for now let's just allow it but maybe logic handles it
-                     pass
-
-            # 2. Temperature Rule (> 28°C)
-            if temp is not None and temp > 28:
-                if "wool" in material or "thick" in desc or cat in ["coat", "parka", "heavy jacket"]:
-                    continue
+        # 2. Temperature Rule (> 28°C), from flags precomputed at load time
+        if temp is None or temp <= 28:
+            return candidates
 
-            filtered.append((item, score))
+        position_of = self._item_positions.get
+        flags = self._is_warm_garment
+        warm_garment = self._warm_garment
+        warm = np.fromiter(
+            (warm_garment(item) if (pos := position_of(id(item))) is None else flags[pos]
+             for item, _ in candidates),
+            dtype=bool, count=len(candidates)
+        )
+        keep = np.flatnonzero(~warm).tolist()
+        filtered = [candidates[i] for i in keep]
 
         return filtered if filtered else candidates
 
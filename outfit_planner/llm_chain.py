@@ -1,19 +1,38 @@
 """LLM-based tools for outfit recommendation using OpenAI API."""
 
+import asyncio
+import hashlib
 import json
 import os
-from typing import List, Dict, Optional
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Iterator, Optional
 
 import openai
 
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
 from src.prompts import (
-    get_explain_outfit_prompt,
-    get_accessory_suggestion_prompt,
-    get_style_validation_prompt,
-    get_weather_check_prompt,
-    get_color_harmony_prompt,
+    render_explain_outfit,
+    render_accessory_suggestion,
+    render_style_validation,
+    render_weather_check,
+    render_color_harmony,
 )
 
+# Responses kept per explainer, keyed on a hash of (model, temperature, prompt)
+PROMPT_CACHE_SIZE = 256
+
+
+def _loads_json(text: str):
+    """Parse a JSON reply (surrounding whitespace allowed); raises json.JSONDecodeError."""
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch either
+    return orjson.loads(text) if HAS_ORJSON else json.loads(text)
+
 
 class OutfitExplainer:
     """Use LLM to generate natural language explanations for outfit recommendations."""
@@ -32,19 +51,82 @@ class OutfitExplainer:
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable not set")
         
-        openai.api_key = api_key
+        # One v1 client per explainer: reuses pooled keep-alive connections across calls
+        self.client = openai.OpenAI(api_key=api_key)
         self.model = model
         self.temperature = temperature
+        self._response_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
 
     def _call_openai(self, prompt: str) -> str:
-        """Call OpenAI API with given prompt."""
-        response = openai.ChatCompletion.create(
+        """
+        Call OpenAI API with given prompt. Prompts are deterministic in their
+        inputs, so identical requests are answered from an in-memory LRU cache.
+        """
+        key = self._cache_key(prompt)
+        cached = self._cached_response(key)
+        if cached is not None:
+            return cached
+        
+        content = self._request_completion(prompt)
+        self._store_response(key, content)
+        return content
+
+    def _stream_openai(self, prompt: str) -> Iterator[str]:
+        """
+        Stream the response to a prompt chunk by chunk (first tokens arrive early).
+        Cached responses are yielded whole; completed streams are added to the cache.
+        """
+        key = self._cache_key(prompt)
+        cached = self._cached_response(key)
+        if cached is not None:
+            yield cached
+            return
+        
+        stream = self.client.chat.completions.create(
             model=self.model,
             messages=[{"role": "user", "content": prompt}],
             temperature=self.temperature,
             max_tokens=500,
+            stream=True,
         )
-        return response["choices"][0]["message"]["content"]
+        parts = []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+        self._store_response(key, "".join(parts))
+
+    def _cache_key(self, prompt: str) -> str:
+        return hashlib.blake2b(
+            f"{self.model}\0{self.temperature}\0{prompt}".encode("utf-8"), digest_size=16
+        ).hexdigest()
+
+    def _cached_response(self, key: str) -> Optional[str]:
+        with self._cache_lock:
+            if key in self._response_cache:
+                self._response_cache.move_to_end(key)
+                return self._response_cache[key]
+        return None
+
+    def _store_response(self, key: str, content: str):
+        with self._cache_lock:
+            self._response_cache[key] = content
+            if len(self._response_cache) > PROMPT_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
+
+    def _request_completion(self, prompt: str) -> str:
+        """Send one chat completion request (uncached)."""
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=self.temperature,
+            max_tokens=500,
+        )
+        return response.choices[0].message.content or ""
 
     def explain_outfit(
         self,
@@ -67,6 +149,37 @@ class OutfitExplainer:
         Returns:
             Multi-line explanation string with bullet points
         """
+        prompt = self._explain_outfit_prompt(items, occasion, weather, user_style, primary_reason)
+        return self._call_openai(prompt).strip()
+
+    def explain_outfit_stream(
+        self,
+        items: List[Dict],
+        occasion: str,
+        weather: Dict,
+        user_style: List[str],
+        primary_reason: str = "comfort and style",
+    ) -> Iterator[str]:
+        """
+        Streaming variant of explain_outfit for user-facing display.
+        
+        Args:
+            Same as explain_outfit
+        
+        Returns:
+            Iterator over explanation text chunks as they arrive
+        """
+        prompt = self._explain_outfit_prompt(items, occasion, weather, user_style, primary_reason)
+        return self._stream_openai(prompt)
+
+    def _explain_outfit_prompt(
+        self,
+        items: List[Dict],
+        occasion: str,
+        weather: Dict,
+        user_style: List[str],
+        primary_reason: str,
+    ) -> str:
         items_str = "\n".join([
             f"- {it['role'].upper()}: {it['title']} ({it['color']}, {it['style']})"
             for it in items
@@ -74,16 +187,13 @@ class OutfitExplainer:
         weather_str = f"{weather['temp_c']}°C, {weather.get('condition', 'unknown')}, humidity {weather.get('humidity', 'N/A')}%"
         style_str = ", ".join(user_style)
         
-        template = get_explain_outfit_prompt()
-        prompt = template.format(
+        return render_explain_outfit(
             items=items_str,
             occasion=occasion,
             weather=weather_str,
             user_style=style_str,
             reason=primary_reason,
         )
-        
-        return self._call_openai(prompt).strip()
 
     def suggest_accessories(
         self,
@@ -104,8 +214,7 @@ class OutfitExplainer:
         Returns:
             List of suggested accessory names
         """
-        template = get_accessory_suggestion_prompt()
-        prompt = template.format(
+        prompt = render_accessory_suggestion(
             top_color=top_color,
             bottom_color=bottom_color,
             occasion=occasion,
@@ -114,7 +223,7 @@ class OutfitExplainer:
         
         result = self._call_openai(prompt)
         try:
-            accessories = json.loads(result.strip())
+            accessories = _loads_json(result)
             return accessories if isinstance(accessories, list) else [accessories]
         except json.JSONDecodeError:
             # fallback: split by comma
@@ -134,15 +243,14 @@ class OutfitExplainer:
         styles_str = ", ".join(styles)
         items_str = "\n".join([f"- {it['title']}" for it in items])
         
-        template = get_style_validation_prompt()
-        prompt = template.format(
+        prompt = render_style_validation(
             styles=styles_str,
             items=items_str,
         )
         
         result = self._call_openai(prompt)
         try:
-            return json.loads(result.strip())
+            return _loads_json(result)
         except json.JSONDecodeError:
             return {"matches": True, "confidence": 0.5, "explanation": result}
 
@@ -167,8 +275,7 @@ class OutfitExplainer:
         """
         items_str = "\n".join([f"- {it['title']} ({it['material']})" for it in items])
         
-        template = get_weather_check_prompt()
-        prompt = template.format(
+        prompt = render_weather_check(
             temp_c=temp_c,
             humidity=humidity,
             condition=condition,
@@ -177,7 +284,7 @@ class OutfitExplainer:
         
         result = self._call_openai(prompt)
         try:
-            return json.loads(result.strip())
+            return _loads_json(result)
         except json.JSONDecodeError:
             return {"suitable": True, "score": 0.7, "adjustment": ""}
 
@@ -193,15 +300,67 @@ class OutfitExplainer:
         """
         colors_str = ", ".join(colors)
         
-        template = get_color_harmony_prompt()
-        prompt = template.format(colors=colors_str)
+        prompt = render_color_harmony(colors=colors_str)
         
         result = self._call_openai(prompt)
         try:
-            return json.loads(result.strip())
+            return _loads_json(result)
         except json.JSONDecodeError:
             return {"harmony_score": 0.75, "notes": "Colors are well-coordinated"}
 
+    async def run_all(
+        self,
+        items: List[Dict],
+        occasion: str,
+        weather: Dict,
+        user_style: List[str],
+        primary_reason: str = "comfort and style",
+    ) -> Dict:
+        """
+        Run all five explanation calls concurrently, so the bundle costs one
+        API round-trip of latency instead of five. Accessory colors come from
+        the top/bottom items and the color list from all items.
+        
+        Args:
+            items: List of outfit items with role, title, color, style, material
+            occasion: Event type (e.g., "office", "date", "casual")
+            weather: Dict with temp_c, humidity, condition
+            user_style: List of user's preferred styles
+            primary_reason: Main reason for recommendation
+        
+        Returns:
+            Dict with explain_outfit, suggest_accessories, validate_style,
+            check_weather and color_harmony results
+        """
+        colors_by_role = {it.get("role"): it.get("color", "") for it in items}
+        
+        # Each call blocks on HTTP; worker threads let the requests overlap
+        explanation, accessories, style_check, weather_check, harmony = await asyncio.gather(
+            asyncio.to_thread(self.explain_outfit, items, occasion, weather, user_style, primary_reason),
+            asyncio.to_thread(
+                self.suggest_accessories,
+                colors_by_role.get("top", ""), colors_by_role.get("bottom", ""), occasion, ", ".join(user_style),
+            ),
+            asyncio.to_thread(self.validate_style, user_style, items),
+            asyncio.to_thread(
+                self.check_weather_suitability,
+                weather["temp_c"], weather.get("humidity", "N/A"), weather.get("condition", "unknown"), items,
+            ),
+            asyncio.to_thread(self.evaluate_color_harmony, [it["color"] for it in items]),
+        )
+        
+        return {
+            "explain_outfit": explanation,
+            "suggest_accessories": accessories,
+            "validate_style": style_check,
+            "check_weather": weather_check,
+            "color_harmony": harmony,
+        }
+
+    def run_all_sync(self, *args, **kwargs) -> Dict:
+        """Blocking wrapper around run_all for callers without an event loop."""
+        return asyncio.run(self.run_all(*args, **kwargs))
+
 
 def create_explanation_tools():
     """
@@ -223,4 +382,6 @@ def create_explanation_tools():
         "validate_style": explainer.validate_style,
         "check_weather": explainer.check_weather_suitability,
         "color_harmony": explainer.evaluate_color_harmony,
+        "explain_outfit_stream": explainer.explain_outfit_stream,
+        "explain_all": explainer.run_all_sync,
     }
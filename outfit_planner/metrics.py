@@ -3,11 +3,61 @@ Evaluation metrics for outfit recommendation system.
 Includes offline (retrieval, ranking) and online (user engagement) metrics.
 """
 
+import functools
 import json
-from typing import List, Dict, Tuple
 from collections import defaultdict
+from typing import List, Dict, Optional, Tuple
 import numpy as np
 
+try:
+    import simsimd
+    HAS_SIMSIMD = True
+except ImportError:
+    HAS_SIMSIMD = False
+
+try:
+    from scipy.sparse import csr_matrix
+    HAS_SCIPY = True
+except ImportError:
+    HAS_SCIPY = False
+
+try:
+    # Resolve the kernels next to this file, whether imported as a package module or a script
+    if __package__:
+        from ._metrics_numba import _precision_at_k, _mrr, _map_at_k
+    else:
+        from _metrics_numba import _precision_at_k, _mrr, _map_at_k
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+
+# Outfit lists at least this long use SimSIMD's cosine kernels (when installed)
+SIMSIMD_MIN_VECTORS = 8
+
+# Rank discounts 1/log2(rank+1), grown on demand and shared by every NDCG call
+_DISCOUNT_CACHE = np.empty(0)
+
+
+def _discount(k: int) -> np.ndarray:
+    """First k DCG rank discounts (1/log2(2), 1/log2(3), ...)."""
+    global _DISCOUNT_CACHE
+    if len(_DISCOUNT_CACHE) < k:
+        size = max(k, 2 * len(_DISCOUNT_CACHE), 16)
+        _DISCOUNT_CACHE = 1.0 / np.log2(np.arange(2, size + 2))
+    return _DISCOUNT_CACHE[:k]
+
+
+def _binary_labels(relevant_items) -> Optional[np.ndarray]:
+    """
+    Labels as the int8 array the numba kernels expect, or None when they are
+    not all 0/1 (graded or float labels would be truncated by the cast).
+    """
+    labels = np.asarray(relevant_items)
+    if not ((labels == 0) | (labels == 1)).all():
+        return None
+    return labels.astype(np.int8)
+
 
 class RecommendationMetrics:
     """Compute offline evaluation metrics."""
@@ -28,16 +78,16 @@ class RecommendationMetrics:
         if not relevance_scores or k <= 0:
             return 0.0
         
-        relevance_scores = relevance_scores[:k]
+        relevance = np.asarray(relevance_scores[:k], dtype=np.float64)
+        discount = _discount(len(relevance))
         
         # DCG = sum(rel_i / log2(i+1))
-        dcg = sum(rel / np.log2(i + 2) for i, rel in enumerate(relevance_scores))
+        dcg = relevance @ discount
         
         # IDCG = DCG of perfect ranking
-        ideal = sorted(relevance_scores, reverse=True)
-        idcg = sum(rel / np.log2(i + 2) for i, rel in enumerate(ideal))
+        idcg = np.sort(relevance)[::-1] @ discount
         
-        return dcg / idcg if idcg > 0 else 0.0
+        return float(dcg / idcg) if idcg > 0 else 0.0
     
     @staticmethod
     def precision_at_k(relevant_items: List[int], k: int = 3) -> float:
@@ -53,6 +103,9 @@ class RecommendationMetrics:
         """
         if not relevant_items or k <= 0:
             return 0.0
+        labels = _binary_labels(relevant_items) if HAS_NUMBA else None
+        if labels is not None:
+            return _precision_at_k(labels, k)
         return sum(relevant_items[:k]) / k
     
     @staticmethod
@@ -67,11 +120,39 @@ class RecommendationMetrics:
         Returns:
             MRR (0-1)
         """
+        labels = _binary_labels(relevant_items) if HAS_NUMBA else None
+        if labels is not None:
+            return _mrr(labels)
         for i, rel in enumerate(relevant_items, 1):
             if rel:
                 return 1.0 / i
         return 0.0
     
+    @staticmethod
+    def mean_reciprocal_rank_batch(pos_scores: np.ndarray, neg_scores: np.ndarray) -> float:
+        """
+        MRR over a batch of queries with one positive each, ranked against
+        negative scores by counting instead of sorting. Ties with a negative
+        count as half a rank above it (mean of the optimistic and pessimistic rank).
+        
+        Args:
+            pos_scores: (M,) score of each query's relevant item
+            neg_scores: (M, K) scores of each query's negatives, or (K,) shared by all queries
+        
+        Returns:
+            MRR (0-1)
+        """
+        pos = np.asarray(pos_scores, dtype=np.float64)
+        neg = np.asarray(neg_scores, dtype=np.float64)
+        if len(pos) == 0:
+            return 0.0
+        
+        # Negatives scored above the positive (optimistic) and at-or-above it (pessimistic)
+        above = (neg > pos[:, None]).sum(axis=1)
+        at_or_above = (neg >= pos[:, None]).sum(axis=1)
+        rank = 0.5 * (above + at_or_above) + 1
+        return float((1.0 / rank).mean())
+    
     @staticmethod
     def map_at_k(relevant_items: List[int], k: int = 3) -> float:
         """
@@ -86,6 +167,9 @@ class RecommendationMetrics:
         """
         if not relevant_items or k <= 0:
             return 0.0
+        labels = _binary_labels(relevant_items) if HAS_NUMBA else None
+        if labels is not None:
+            return _map_at_k(labels, k)
         
         relevant_items = relevant_items[:k]
         precisions = []
@@ -96,13 +180,19 @@ class RecommendationMetrics:
         return sum(precisions) / len(relevant_items) if relevant_items else 0.0
     
     @staticmethod
-    def diversity_score(outfit_vectors: List[List[float]]) -> float:
+    def diversity_score(outfit_vectors: List[List[float]], dtype: str = 'f32') -> float:
         """
         Intra-list diversity: average pairwise distance between outfits.
         Encourages variety in recommendations.
         
         Args:
-            outfit_vectors: List of embedding vectors for outfits
+            outfit_vectors: List of embedding vectors for outfits. A float16
+                numpy array keeps half precision and, with SimSIMD installed,
+                uses its FP16 kernels
+            dtype: 'f32' for float embeddings, or 'i8' for int8-quantized ones,
+                e.g. np.round(v / scale).astype(np.int8) with scale = np.abs(v).max() / 127.
+                With SimSIMD installed, int8 vectors use its integer cosine kernels
+                (a quarter of the float32 memory traffic)
         
         Returns:
             Diversity score (0-1, higher = more diverse)
@@ -110,19 +200,32 @@ class RecommendationMetrics:
         if len(outfit_vectors) < 2:
             return 1.0
         
-        outfit_vectors = np.array(outfit_vectors)
+        if dtype == 'i8':
+            vectors = np.asarray(outfit_vectors, dtype=np.int8)
+            if not (HAS_SIMSIMD and len(vectors) >= SIMSIMD_MIN_VECTORS):
+                vectors = vectors.astype(np.float64)
+        else:
+            vectors = np.asarray(outfit_vectors)
+            if not np.issubdtype(vectors.dtype, np.floating):
+                vectors = vectors.astype(np.float64)
+        n = len(vectors)
+        
+        if HAS_SIMSIMD and n >= SIMSIMD_MIN_VECTORS:
+            # SIMD cosine distances (normalization is done inside the kernel)
+            distances = np.asarray(simsimd.cdist(vectors, vectors, metric='cosine'))
+            return float((distances.sum(dtype=np.float64) - np.trace(distances, dtype=np.float64)) / (n * (n - 1)))
+        
         # Normalize vectors
-        norms = np.linalg.norm(outfit_vectors, axis=1, keepdims=True)
-        outfit_vectors = outfit_vectors / (norms + 1e-8)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / (norms + 1e-8)
         
-        # Compute pairwise cosine distances (1 - similarity)
-        distances = []
-        for i in range(len(outfit_vectors)):
-            for j in range(i + 1, len(outfit_vectors)):
-                sim = np.dot(outfit_vectors[i], outfit_vectors[j])
-                distances.append(1 - sim)
+        # All pairwise cosine similarities in one GEMM; the mean over pairs i < j is
+        # the off-diagonal mean of the symmetric matrix
+        sim = vectors @ vectors.T
+        mean_sim = (sim.sum(dtype=np.float64) - np.trace(sim, dtype=np.float64)) / (n * (n - 1))
         
-        return np.mean(distances) if distances else 0.0
+        # Average pairwise cosine distance (1 - similarity)
+        return float(1.0 - mean_sim)
     
     @staticmethod
     def calibration_score(predicted_scores: List[float], actual_labels: List[int]) -> float:
@@ -143,20 +246,24 @@ class RecommendationMetrics:
         predicted_scores = np.array(predicted_scores)
         actual_labels = np.array(actual_labels)
         
-        # Bin predictions by score ranges
-        bins = np.linspace(0, 1, 11)  # 0-10%, 10-20%, ..., 90-100%
-        calibration_error = 0.0
-        count = 0
-        
-        for i in range(len(bins) - 1):
-            mask = (predicted_scores >= bins[i]) & (predicted_scores < bins[i + 1])
-            if mask.sum() > 0:
-                expected = np.mean(predicted_scores[mask])
-                actual = np.mean(actual_labels[mask])
-                calibration_error += abs(expected - actual)
-                count += 1
-        
-        return calibration_error / count if count > 0 else 0.0
+        # Bin predictions by score ranges (0-10%, 10-20%, ..., 90-100%) in one pass;
+        # a score of exactly 1.0 belongs to the last bin, out-of-range scores to none
+        bins = np.linspace(0, 1, 11)
+        n_bins = len(bins) - 1
+        in_range = (predicted_scores >= 0) & (predicted_scores <= 1)
+        predicted_scores = predicted_scores[in_range]
+        actual_labels = actual_labels[in_range]
+        idx = np.minimum(np.digitize(predicted_scores, bins) - 1, n_bins - 1)
+        
+        counts = np.bincount(idx, minlength=n_bins)
+        predicted_sums = np.bincount(idx, weights=predicted_scores, minlength=n_bins)
+        actual_sums = np.bincount(idx, weights=actual_labels, minlength=n_bins)
+        
+        filled = counts > 0
+        if not filled.any():
+            return 0.0
+        errors = np.abs(predicted_sums[filled] / counts[filled] - actual_sums[filled] / counts[filled])
+        return float(errors.sum() / filled.sum())
     
     @staticmethod
     def coverage(recommended_items: List[str], catalog_size: int) -> float:
@@ -188,31 +295,108 @@ class RecommendationMetrics:
         if len(user_profiles) < 2:
             return 1.0
         
-        users = list(user_profiles.values())
-        overlaps = []
-        
-        for i in range(len(users)):
-            for j in range(i + 1, len(users)):
-                set_i = set(users[i])
-                set_j = set(users[j])
-                if set_i and set_j:
-                    overlap = len(set_i & set_j) / min(len(set_i), len(set_j))
-                    overlaps.append(overlap)
+        # Pairs involving a user with no recommendations are skipped
+        users = [set(items) for items in user_profiles.values()]
+        users = [items for items in users if items]
+        if len(users) < 2:
+            return 1.0
         
-        return 1 - (np.mean(overlaps) if overlaps else 0)
+        # User x item indicator matrix; M @ M.T holds every pairwise |A & B|
+        item_to_col: Dict[str, int] = {}
+        indices = np.fromiter(
+            (item_to_col.setdefault(item, len(item_to_col)) for items in users for item in items),
+            dtype=np.int64,
+        )
+        sizes = np.fromiter((len(items) for items in users), dtype=np.int64, count=len(users))
+        indptr = np.concatenate(([0], np.cumsum(sizes)))
+        shape = (len(users), len(item_to_col))
+        
+        if HAS_SCIPY:
+            M = csr_matrix((np.ones(len(indices), dtype=np.int32), indices, indptr), shape=shape)
+            overlap_counts = (M @ M.T).toarray()
+        else:
+            M = np.zeros(shape, dtype=np.float32)
+            M[np.repeat(np.arange(len(users)), sizes), indices] = 1.0
+            overlap_counts = M @ M.T
+        
+        iu, ju = np.triu_indices(len(users), k=1)
+        overlaps = overlap_counts[iu, ju] / np.minimum(sizes[iu], sizes[ju])
+        return 1 - float(np.mean(overlaps))
+
+
+@functools.lru_cache(maxsize=256)
+def _chi2_2x2(a: int, b: int, c: int, d: int) -> Tuple[float, float]:
+    """Chi-squared statistic and p-value of [[a, b], [c, d]]; memoized, so polling unchanged buckets is free."""
+    from scipy.stats import chi2_contingency
+    
+    chi2, p_value, dof, expected = chi2_contingency([[a, b], [c, d]])
+    return chi2, p_value
+
+
+# Event type -> OnlineMetrics counter field
+_EVENT_FIELDS = {
+    "show": "shown",
+    "click": "clicked",
+    "apply": "applied",
+    "purchase": "purchased",
+    "dislike": "dislikes",
+}
 
 
 class OnlineMetrics:
     """Track online evaluation metrics from user interactions."""
     
+    # Counter columns, in storage order
+    FIELDS = ("shown", "clicked", "applied", "purchased", "dislikes")
+    
     def __init__(self):
-        self.interactions = defaultdict(lambda: {
-            "shown": 0,
-            "clicked": 0,
-            "applied": 0,
-            "purchased": 0,
-            "dislikes": 0,
-        })
+        # Per-outfit counters as one int64 row per outfit (SoA), grown by doubling
+        self._cols = {field: i for i, field in enumerate(self.FIELDS)}
+        self._idx: Dict[str, int] = {}
+        self._counts = np.zeros((16, len(self.FIELDS)), dtype=np.int64)
+        # Running totals across all outfits, so the aggregate getters are O(1)
+        self._totals = {field: 0 for field in self.FIELDS}
+    
+    def _zero_counts(self) -> Dict[str, int]:
+        """Counters of an outfit with no interactions."""
+        return {field: 0 for field in self.FIELDS}
+    
+    @property
+    def interactions(self) -> Dict[str, Dict[str, int]]:
+        """
+        Per-outfit counters as {outfit_id: {field: count}}. This is a snapshot
+        built from the counter array on every access: writes to it are not
+        recorded (use log_interaction), and unseen ids read as zero counts as
+        before. For a single outfit prefer get_outfit_counts.
+        """
+        counts = self._counts[:len(self._idx)].tolist()
+        snapshot = defaultdict(self._zero_counts)
+        for outfit_id, row in self._idx.items():
+            snapshot[outfit_id] = dict(zip(self.FIELDS, counts[row]))
+        return snapshot
+    
+    def get_outfit_counts(self, outfit_id: str) -> Dict[str, int]:
+        """Counters of one outfit (all zero if it was never logged)."""
+        row = self._idx.get(outfit_id)
+        if row is None:
+            return self._zero_counts()
+        return dict(zip(self.FIELDS, self._counts[row].tolist()))
+    
+    def get_totals(self) -> Dict[str, int]:
+        """Counters summed over all outfits, as {field: count} (a copy)."""
+        return dict(self._totals)
+    
+    def _row(self, outfit_id: str) -> int:
+        """Counter row of an outfit, allocating one on first sight."""
+        row = self._idx.get(outfit_id)
+        if row is None:
+            row = len(self._idx)
+            if row == len(self._counts):
+                grown = np.zeros((2 * len(self._counts), len(self.FIELDS)), dtype=np.int64)
+                grown[:row] = self._counts
+                self._counts = grown
+            self._idx[outfit_id] = row
+        return row
     
     def log_interaction(
         self,
@@ -220,38 +404,37 @@ class OnlineMetrics:
         event_type: str,  # 'show', 'click', 'apply', 'purchase', 'dislike'
     ):
         """Log a user interaction with an outfit."""
-        event_map = {
-            "show": "shown",
-            "click": "clicked",
-            "apply": "applied",
-            "purchase": "purchased",
-            "dislike": "dislikes",
-        }
-        if event_type in event_map:
-            self.interactions[outfit_id][event_map[event_type]] += 1
+        field = _EVENT_FIELDS.get(event_type)
+        if field is None:
+            return
+        row = self._idx.get(outfit_id)
+        if row is None:
+            row = self._row(outfit_id)  # may reallocate self._counts
+        self._counts[row, self._cols[field]] += 1
+        self._totals[field] += 1
     
     def get_ctr(self) -> float:
         """Click-through rate: clicked / shown."""
-        total_shown = sum(v["shown"] for v in self.interactions.values())
-        total_clicked = sum(v["clicked"] for v in self.interactions.values())
+        total_shown = self._totals["shown"]
+        total_clicked = self._totals["clicked"]
         return total_clicked / total_shown if total_shown > 0 else 0.0
     
     def get_acceptance_rate(self) -> float:
         """Acceptance rate: applied / shown."""
-        total_shown = sum(v["shown"] for v in self.interactions.values())
-        total_applied = sum(v["applied"] for v in self.interactions.values())
+        total_shown = self._totals["shown"]
+        total_applied = self._totals["applied"]
         return total_applied / total_shown if total_shown > 0 else 0.0
     
     def get_conversion_rate(self) -> float:
         """Conversion rate: purchased / applied."""
-        total_applied = sum(v["applied"] for v in self.interactions.values())
-        total_purchased = sum(v["purchased"] for v in self.interactions.values())
+        total_applied = self._totals["applied"]
+        total_purchased = self._totals["purchased"]
         return total_purchased / total_applied if total_applied > 0 else 0.0
     
     def get_dislike_rate(self) -> float:
         """Dislike rate: dislikes / shown."""
-        total_shown = sum(v["shown"] for v in self.interactions.values())
-        total_dislikes = sum(v["dislikes"] for v in self.interactions.values())
+        total_shown = self._totals["shown"]
+        total_dislikes = self._totals["dislikes"]
         return total_dislikes / total_shown if total_shown > 0 else 0.0
     
     def get_summary(self) -> Dict:
@@ -261,9 +444,7 @@ class OnlineMetrics:
             "acceptance_rate": self.get_acceptance_rate(),
             "conversion_rate": self.get_conversion_rate(),
             "dislike_rate": self.get_dislike_rate(),
-            "total_interactions": sum(
-                sum(v.values()) for v in self.interactions.values()
-            ),
+            "total_interactions": sum(self._totals.values()),
         }
 
 
@@ -292,25 +473,20 @@ class ABTestFramework:
         if variant_a not in self.variants or variant_b not in self.variants:
             return {"error": "Variant not found"}
         
-        from scipy.stats import chi2_contingency
-        
         metrics_a = self.variants[variant_a]
         metrics_b = self.variants[variant_b]
         
         # Simple CTR comparison
         if metric == "ctr":
-            total_shown_a = sum(v["shown"] for v in metrics_a.interactions.values())
-            total_clicked_a = sum(v["clicked"] for v in metrics_a.interactions.values())
-            
-            total_shown_b = sum(v["shown"] for v in metrics_b.interactions.values())
-            total_clicked_b = sum(v["clicked"] for v in metrics_b.interactions.values())
+            totals_a = metrics_a.get_totals()
+            totals_b = metrics_b.get_totals()
+            total_shown_a, total_clicked_a = totals_a["shown"], totals_a["clicked"]
+            total_shown_b, total_clicked_b = totals_b["shown"], totals_b["clicked"]
             
-            contingency_table = [
-                [total_clicked_a, total_shown_a - total_clicked_a],
-                [total_clicked_b, total_shown_b - total_clicked_b],
-            ]
-            
-            chi2, p_value, dof, expected = chi2_contingency(contingency_table)
+            chi2, p_value = _chi2_2x2(
+                total_clicked_a, total_shown_a - total_clicked_a,
+                total_clicked_b, total_shown_b - total_clicked_b,
+            )
             
             ctr_a = total_clicked_a / total_shown_a if total_shown_a > 0 else 0
             ctr_b = total_clicked_b / total_shown_b if total_shown_b > 0 else 0
@@ -328,9 +504,38 @@ class ABTestFramework:
         return {"error": f"Metric {metric} not implemented"}
 
 
+def _ndcg_prefix(relevance_scores: List[float], ks: Tuple[int, ...]) -> List[float]:
+    """
+    NDCG@k for several cutoffs from one pass: DCG values are prefix sums of
+    rel * discount, and a single descending sort of the top max(ks) scores yields
+    every prefix's ideal ordering (same result as ndcg_at_k for each k).
+    """
+    if not relevance_scores:
+        return [0.0] * len(ks)
+    
+    relevance = np.asarray(relevance_scores[:max(ks)], dtype=np.float64)
+    discount = _discount(len(relevance))
+    dcg = np.cumsum(relevance * discount)
+    # Stable descending order of the scores; the prefix of length k keeps positions < k
+    order = np.argsort(-relevance, kind='stable')
+    
+    ndcg = []
+    for k in ks:
+        n = min(k, len(relevance))
+        if n <= 0:
+            ndcg.append(0.0)
+            continue
+        ideal = relevance[order[order < n]]
+        idcg = ideal @ discount[:n]
+        ndcg.append(float(dcg[n - 1] / idcg) if idcg > 0 else 0.0)
+    return ndcg
+
+
 def evaluate_ranking_model(predictions: List[float], labels: List[int], k: int = 3) -> Dict:
     """
     Comprehensive evaluation of ranking model.
+    NDCG cutoffs share one sort, and precision/MAP/MRR share one cumulative
+    sum of the labels.
     
     Args:
         predictions: Model's prediction scores
@@ -340,19 +545,97 @@ def evaluate_ranking_model(predictions: List[float], labels: List[int], k: int =
     Returns:
         Dict of all metrics
     """
-    metrics = RecommendationMetrics()
+    ndcg_3, ndcg_5, ndcg_10 = _ndcg_prefix(predictions, (3, 5, 10))
+    
+    rel = np.asarray(labels, dtype=np.float64)
+    csum = np.cumsum(rel)
+    
+    def precision(cutoff: int) -> float:
+        return float(csum[min(cutoff, len(rel)) - 1] / cutoff) if len(rel) else 0.0
+    
+    # MAP@5: precision at each relevant position within the top 5, over the cutoff length
+    top = rel[:5]
+    hits = np.flatnonzero(top)
+    map_at_5 = float((csum[hits] / (hits + 1)).sum() / len(top)) if len(top) else 0.0
+    
+    relevant = np.flatnonzero(rel)
+    mrr = 1.0 / (relevant[0] + 1) if len(relevant) else 0.0
     
     return {
-        "ndcg_at_3": metrics.ndcg_at_k(predictions, k=3),
-        "ndcg_at_5": metrics.ndcg_at_k(predictions, k=5),
-        "ndcg_at_10": metrics.ndcg_at_k(predictions, k=10),
-        "precision_at_3": metrics.precision_at_k(labels, k=3),
-        "precision_at_5": metrics.precision_at_k(labels, k=5),
-        "map_at_5": metrics.map_at_k(labels, k=5),
-        "mrr": metrics.mean_reciprocal_rank(labels),
+        "ndcg_at_3": ndcg_3,
+        "ndcg_at_5": ndcg_5,
+        "ndcg_at_10": ndcg_10,
+        "precision_at_3": precision(3),
+        "precision_at_5": precision(5),
+        "map_at_5": map_at_5,
+        "mrr": float(mrr),
     }
 
 
+def evaluate_batch(predictions: np.ndarray, labels: np.ndarray, ks: Tuple[int, ...] = (3, 5, 10)) -> Dict:
+    """
+    Ranking metrics for a batch of queries, vectorized across all rows at once.
+    Each row's candidates are ranked by descending prediction score (ties keep
+    column order) and scored against that row's labels; the discount vector and
+    cumulative sums are shared by every cutoff.
+    
+    Args:
+        predictions: (M, N) model scores, one row per query
+        labels: (M, N) ground truth relevance labels (binary or graded)
+        ks: Top-k cutoffs for NDCG/Precision/MAP
+    
+    Returns:
+        Dict of metrics averaged over the M queries
+    """
+    P = np.asarray(predictions, dtype=np.float64)
+    Y = np.asarray(labels, dtype=np.float64)
+    if P.ndim != 2 or P.shape != Y.shape:
+        raise ValueError(f"predictions and labels must be (M, N) arrays of the same shape, got {P.shape} and {Y.shape}")
+    
+    n_queries, n_items = P.shape
+    maxk = min(max(ks, default=0), n_items)
+    if n_queries == 0 or maxk <= 0:
+        results = {f"{name}_at_{k}": 0.0 for name in ("ndcg", "precision", "map") for k in ks}
+        results["mrr"] = 0.0
+        return results
+    
+    # Labels in ranked order, one stable sort per row
+    order = np.argsort(-P, axis=1, kind='stable')
+    ranked = np.take_along_axis(Y, order, axis=1)
+    top = ranked[:, :maxk]
+    
+    discount = _discount(maxk)
+    dcg = np.cumsum(top * discount, axis=1)
+    ideal = -np.sort(-Y, axis=1)[:, :maxk]
+    idcg = np.cumsum(ideal * discount, axis=1)
+    
+    # Precision/MAP: cumulative hits, and precision summed over relevant positions
+    csum = np.cumsum(top, axis=1)
+    ap_csum = np.cumsum(np.where(top != 0, csum / np.arange(1, maxk + 1), 0.0), axis=1)
+    
+    ndcg, precision, average_precision = {}, {}, {}
+    for k in ks:
+        n = min(k, n_items)
+        if n <= 0:
+            ndcg[k] = precision[k] = average_precision[k] = 0.0
+            continue
+        ideal_k = idcg[:, n - 1]
+        ndcg[k] = float(np.mean(np.where(ideal_k > 0, dcg[:, n - 1] / np.where(ideal_k > 0, ideal_k, 1.0), 0.0)))
+        precision[k] = float(np.mean(csum[:, n - 1] / k))
+        average_precision[k] = float(np.mean(ap_csum[:, n - 1] / n))
+    
+    # MRR: first relevant position of each ranked row
+    relevant = ranked != 0
+    first = np.argmax(relevant, axis=1)
+    mrr = np.where(relevant.any(axis=1), 1.0 / (first + 1), 0.0)
+    
+    results = {f"ndcg_at_{k}": v for k, v in ndcg.items()}
+    results.update({f"precision_at_{k}": v for k, v in precision.items()})
+    results.update({f"map_at_{k}": v for k, v in average_precision.items()})
+    results["mrr"] = float(mrr.mean())
+    return results
+
+
 if __name__ == "__main__":
     # Example usage
     print("Recommendation Metrics Module")
@@ -171,6 +171,41 @@ Respond ONLY with valid JSON, ensure Traditional Chinese for reasoning if needed
 )
 
 
+# Raw format strings for the render hot path: str.format_map yields the same text
+# as PromptTemplate.format, without LangChain's per-call input validation.
+# The PromptTemplate objects above remain the LangChain interop objects.
+EXPLAIN_OUTFIT_TEMPLATE = EXPLAIN_OUTFIT_PROMPT.template
+ACCESSORY_SUGGESTION_TEMPLATE = ACCESSORY_SUGGESTION_PROMPT.template
+STYLE_VALIDATION_TEMPLATE = STYLE_VALIDATION_PROMPT.template
+WEATHER_CHECK_TEMPLATE = WEATHER_CHECK_PROMPT.template
+COLOR_HARMONY_TEMPLATE = COLOR_HARMONY_PROMPT.template
+
+
+def render_explain_outfit(**kwargs) -> str:
+    """Render the main outfit explanation prompt."""
+    return EXPLAIN_OUTFIT_TEMPLATE.format_map(kwargs)
+
+
+def render_accessory_suggestion(**kwargs) -> str:
+    """Render the accessory suggestion prompt."""
+    return ACCESSORY_SUGGESTION_TEMPLATE.format_map(kwargs)
+
+
+def render_style_validation(**kwargs) -> str:
+    """Render the style validation prompt."""
+    return STYLE_VALIDATION_TEMPLATE.format_map(kwargs)
+
+
+def render_weather_check(**kwargs) -> str:
+    """Render the weather check prompt."""
+    return WEATHER_CHECK_TEMPLATE.format_map(kwargs)
+
+
+def render_color_harmony(**kwargs) -> str:
+    """Render the color harmony prompt."""
+    return COLOR_HARMONY_TEMPLATE.format_map(kwargs)
+
+
 def get_explain_outfit_prompt():
     """Get the main outfit explanation prompt."""
     return EXPLAIN_OUTFIT_PROMPT
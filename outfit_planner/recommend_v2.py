@@ -12,12 +12,23 @@ Output format optimized for Part 4 (Virtual Try-On Presenter)
 
 import json
 import os
+import re
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, is_dataclass
 
-from src.data_loader_v2 import CatalogLoaderV2
-from src.mock_context_v2 import select_context, validate_context
+# Resolve siblings next to this file, whether imported as a package module (src.*) or
+# with this directory on sys.path (main.py: outfit_planner.py shadows the directory)
+if __package__:
+    from .data_loader_v2 import CatalogLoaderV2
+else:
+    from data_loader_v2 import CatalogLoaderV2
+
+# Fields main.py's Step3Input carries into Step 3
+STEP3_FIELDS = ("user_query", "weather", "occasion", "user_profile")
+
+# First temperature in a weather summary such as "Sunny, 28°C"
+_TEMPERATURE_PATTERN = re.compile(r'(-?\d+(?:\.\d+)?)\s*°')
 
 
 @dataclass
@@ -48,18 +59,62 @@ class OutfitRecommenderV2:
     
     def __init__(
         self,
-        descriptions_path: str = "src/outfit_descriptions.json",
-        embeddings_path: str = "src/outfit_embeddings.npy",
+        base_path: str = ".",
         model_name: str = "all-MiniLM-L6-v2",
         auto_detect_model: bool = True
     ):
+        """
+        Args:
+            base_path: Directory holding the Step 1 catalog files (json/npy)
+            model_name: Sentence transformer model for encoding queries
+            auto_detect_model: If True, try to auto-detect a compatible model
+        """
         self.catalog_loader = CatalogLoaderV2(
-            descriptions_path=descriptions_path,
-            embeddings_path=embeddings_path,
+            base_path=base_path,
             model_name=model_name,
             auto_detect_model=auto_detect_model
         )
     
+    def warmup(self):
+        """Compile the catalog scoring kernel before the first recommendation."""
+        self.catalog_loader.warmup()
+    
+    def recommend_outfit(self, step3_input: Any, top_k: int = 5) -> Dict[str, Any]:
+        """
+        Step 3 entry point used by main.py.
+        
+        Args:
+            step3_input: main.Step3Input, or a dict with the same fields
+            top_k: Number of candidates retrieved before selection
+        
+        Returns:
+            RecommendationOutput as a dict (Step 4 handoff)
+        """
+        context = self._step3_context(step3_input)
+        candidates = self._retrieve_candidates(context, top_k)
+        return self._recommend_candidates(context, candidates).to_dict()
+    
+    def recommend_outfit_batch(self, step3_inputs: List[Any], top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Step 3 for several inputs at once: the retrieval queries are encoded in one
+        call and scored against the catalog in one matrix product
+        (CatalogLoaderV2.batch_search) instead of one search per input.
+        
+        Args:
+            step3_inputs: main.Step3Input objects or dicts with the same fields
+            top_k: Number of candidates retrieved per input before selection
+        
+        Returns:
+            One RecommendationOutput dict per input, in order
+        """
+        contexts = [self._step3_context(step3_input) for step3_input in step3_inputs]
+        queries = [self._candidate_query(context) for context in contexts]
+        batch_candidates = self.catalog_loader.batch_search(queries, top_k=top_k, threshold=0.0)
+        return [
+            self._recommend_candidates(context, candidates).to_dict()
+            for context, candidates in zip(contexts, batch_candidates)
+        ]
+    
     def recommend(
         self,
         context: Optional[Dict[str, Any]] = None,
@@ -70,7 +125,11 @@ class OutfitRecommenderV2:
         Generate outfit recommendation.
         Enforces: One-piece Dress OR Top + Bottom (Tone-on-Tone preference).
         """
-        # 1. RETRIEVE: Load context
+        # 1. RETRIEVE: Load context (mock scenarios are only needed on this path)
+        if __package__:
+            from .mock_context_v2 import select_context, validate_context
+        else:
+            from mock_context_v2 import select_context, validate_context
         if context is None:
             context = select_context(scenario)
         
@@ -79,7 +138,14 @@ class OutfitRecommenderV2:
         
         # 2. RETRIEVE: Get candidate outfits via hybrid search
         candidates = self._retrieve_candidates(context, top_k)
-
+        return self._recommend_candidates(context, candidates)
+    
+    def _recommend_candidates(
+        self,
+        context: Dict[str, Any],
+        candidates: List[tuple]
+    ) -> RecommendationOutput:
+        """Filter, select, compose and generate the recommendation for retrieved candidates."""
         # Hard metadata filtering
         try:
             candidates = self.catalog_loader.filter_metadata(context, candidates)
@@ -229,9 +295,41 @@ class OutfitRecommenderV2:
         
         return best_match
 
+    @staticmethod
+    def _step3_context(step3_input: Any) -> Dict[str, Any]:
+        """
+        Context dict the chain reads, from a Step3Input dataclass or a plain dict
+        (whose user_profile may itself be a UserStyle dataclass). A weather summary string ("Sunny, 28°C") becomes a weather dict with the
+        parsed temperature, as used by the retrieval and filtering rules.
+        """
+        if is_dataclass(step3_input):
+            step3_input = asdict(step3_input)
+        context = dict(step3_input)
+        
+        missing = [name for name in STEP3_FIELDS if name not in context]
+        if missing:
+            raise ValueError(f"Invalid Step 3 input: missing {', '.join(missing)}")
+        
+        if is_dataclass(context["user_profile"]):
+            context["user_profile"] = asdict(context["user_profile"])
+        
+        weather = context["weather"]
+        if isinstance(weather, str):
+            match = _TEMPERATURE_PATTERN.search(weather)
+            weather = {"summary": weather}
+            if match:
+                weather["temperature"] = weather["temperature_c"] = float(match.group(1))
+            context["weather"] = weather
+        return context
+
     # --- Standard Retrieval & Reasoning Logic (Preserved) ---
 
     def _retrieve_candidates(self, context: Dict[str, Any], top_k: int = 5) -> List[tuple]:
+        search_query = self._candidate_query(context)
+        return self.catalog_loader.search_by_text(query=search_query, top_k=top_k, threshold=0.0)
+    
+    def _candidate_query(self, context: Dict[str, Any]) -> str:
+        """Retrieval query text from the user query, temperature and style profile."""
         query_parts = []
         if "user_query" in context:
             query_parts.append(context["user_query"])
@@ -247,8 +345,7 @@ class OutfitRecommenderV2:
         if "personal_color" in user_profile:
             query_parts.append(user_profile["personal_color"])
             
-        search_query = " ".join(query_parts)
-        return self.catalog_loader.search_by_text(query=search_query, top_k=top_k, threshold=0.0)
+        return " ".join(query_parts)
     
     def _think_and_select(self, context: Dict[str, Any], candidates: List[tuple]) -> tuple:
         best_item = None
@@ -303,6 +400,9 @@ class OutfitRecommenderV2:
             task_id="error", selected_outfit={}, reasoning_log="No matches found", vton_generation_prompt=""
         )
 
+# Name main.py imports the Step 3 recommender under
+HybridRecommender = OutfitRecommenderV2
+
 if __name__ == "__main__":
     # Test block
     print("Running Recommendation Logic Test...")
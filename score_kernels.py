@@ -0,0 +1,37 @@
+"""
+Score Kernels
+Similarity kernels shared by the embedding builder, the outfit planner and the catalog loader.
+Uses a numba-compiled parallel loop when numba is installed and falls back to a NumPy matrix-vector product.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+
+if HAS_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def dot_scores(matrix, vector):
+        """Dot product of the vector against every row of the matrix, parallel over rows."""
+        n, d = matrix.shape
+        scores = np.empty(n, dtype=np.float32)
+        for i in prange(n):
+            acc = np.float32(0.0)
+            for j in range(d):
+                acc += matrix[i, j] * vector[j]
+            scores[i] = acc
+        return scores
+else:
+    def dot_scores(matrix, vector):
+        """Dot product of the vector against every row of the matrix."""
+        return matrix @ vector
+
+
+def warmup_dot_scores(dim: int):
+    """Compile dot_scores for float32 inputs ahead of the first real call (no-op without numba)."""
+    if HAS_NUMBA:
+        dot_scores(np.ones((2, dim), dtype=np.float32), np.ones(dim, dtype=np.float32))
@@ -1,13 +1,13 @@
 import json
 import os
 
-def standardize_data():
+def standardize_data(input_path='outfit_descriptions.json', output_path='catalog_standardized.json'):
     # 1. 讀取原始描述
-    if not os.path.exists('outfit_descriptions.json'):
-        print("Error: outfit_descriptions.json not found!")
+    if not os.path.exists(input_path):
+        print(f"Error: {input_path} not found!")
         return
 
-    with open('outfit_descriptions.json', 'r', encoding='utf-8') as f:
+    with open(input_path, 'r', encoding='utf-8') as f:
         raw_data = json.load(f)
 
     # 2. 定義簡單的關鍵字映射
@@ -40,7 +40,7 @@ def standardize_data():
         }
 
     # 3. 存檔供 Step 3 使用
-    with open('catalog_standardized.json', 'w', encoding='utf-8') as f:
+    with open(output_path, 'w', encoding='utf-8') as f:
         json.dump(standardized, f, indent=2, ensure_ascii=False)
     
     print(f"Standardization complete. Converted {len(standardized)} items.")
@@ -0,0 +1,18 @@
+"""
+Test setup: make the repo root importable and expose outfit_planner/ as the
+`src` package its modules import from (outfit_planner.py shadows the directory).
+"""
+
+import sys
+import types
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+if 'src' not in sys.modules:
+    src = types.ModuleType('src')
+    src.__path__ = [str(ROOT / 'outfit_planner')]
+    sys.modules['src'] = src
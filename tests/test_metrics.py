@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip("numba")
+
+from src import metrics
+from src.metrics import RecommendationMetrics as M
+
+
+BINARY_CASES = [
+    [1, 0, 1, 1, 0],
+    [0, 0, 0],
+    [0, 1],
+    [True, False, True],
+]
+
+
+def _python_fallback(monkeypatch, fn, *args):
+    with monkeypatch.context() as m:
+        m.setattr(metrics, "HAS_NUMBA", False)
+        return fn(*args)
+
+
+def _record_calls(monkeypatch, calls):
+    for name in ("_precision_at_k", "_mrr", "_map_at_k"):
+        kernel = getattr(metrics, name)
+
+        def traced(*args, _name=name, _kernel=kernel):
+            calls.append(_name)
+            return _kernel(*args)
+
+        monkeypatch.setattr(metrics, name, traced)
+
+
+def test_numba_kernels_are_loaded():
+    assert metrics.HAS_NUMBA
+
+
+@pytest.mark.parametrize("labels", BINARY_CASES)
+def test_jit_matches_python_fallback(monkeypatch, labels):
+    calls = []
+    _record_calls(monkeypatch, calls)
+
+    for fn, args in ((M.precision_at_k, (labels, 3)), (M.mean_reciprocal_rank, (labels,)), (M.map_at_k, (labels, 3))):
+        assert fn(*args) == pytest.approx(_python_fallback(monkeypatch, fn, *args))
+    assert calls == ["_precision_at_k", "_mrr", "_map_at_k"]
+
+
+@pytest.mark.parametrize("labels", [[0.5, 1, 0], [2, 0, 1], [200, 0, 0]])
+def test_graded_labels_use_python_path(monkeypatch, labels):
+    calls = []
+    _record_calls(monkeypatch, calls)
+
+    assert M.precision_at_k(labels, 3) == pytest.approx(sum(labels[:3]) / 3)
+    assert M.mean_reciprocal_rank(labels) == 1.0
+    assert M.map_at_k(labels, 3) > 0
+    assert calls == []
@@ -0,0 +1,96 @@
+import shutil
+
+import pytest
+
+pytest.importorskip("dotenv")
+
+from conftest import ROOT
+from main import Step3Input, UserStyle
+from src.recommend_v2 import HybridRecommender
+
+
+@pytest.fixture(scope="module")
+def recommender(tmp_path_factory):
+    # Copy of the Step 1 artifacts, so the loader's normalized cache stays out of the repo
+    base = tmp_path_factory.mktemp("catalog")
+    for name in ("catalog_standardized.json", "outfit_embeddings.npy"):
+        shutil.copy(ROOT / name, base / name)
+    return HybridRecommender(base_path=str(base))
+
+
+def _step3_input():
+    return Step3Input(
+        user_query="I want something cute and breathable.",
+        weather="Sunny, 28°C",
+        occasion="Casual Weekend Date",
+        user_profile=UserStyle(
+            personal_color="Summer Mute",
+            style_preferences=["Minimalist", "Pastel Colors"],
+            gender="Female",
+        ),
+    )
+
+
+def test_step3_input_end_to_end(recommender):
+    decision = recommender.recommend_outfit(_step3_input())
+
+    assert decision["selected_outfit"]["filename"].endswith(".jpg")
+    assert decision["vton_generation_prompt"]
+    assert 0.0 <= decision["confidence_score"] <= 1.0
+
+
+def test_warmup_compiles_loader_kernel(recommender, monkeypatch):
+    import src.data_loader_v2 as data_loader_v2
+
+    dims = []
+    monkeypatch.setattr(data_loader_v2, "warmup_dot_scores", dims.append)
+    recommender.warmup()
+
+    assert dims == [recommender.catalog_loader.embeddings_norm.shape[1]]
+
+
+def test_batch_matches_single_and_searches_once(recommender, monkeypatch):
+    winter = {
+        "user_query": "warm coat for winter",
+        "weather": "Snow, -2°C",
+        "occasion": "Commute",
+        "user_profile": {"personal_color": "Winter", "style_preferences": ["Classic"], "gender": "Male"},
+    }
+    inputs = [_step3_input(), winter]
+    singles = [recommender.recommend_outfit(step3_input) for step3_input in inputs]
+
+    loader = recommender.catalog_loader
+    calls = []
+    batch_search = loader.batch_search
+    monkeypatch.setattr(loader, "batch_search", lambda queries, **kw: calls.append(queries) or batch_search(queries, **kw))
+    batch = recommender.recommend_outfit_batch(inputs)
+
+    assert len(calls) == 1 and len(calls[0]) == len(inputs)
+    assert [d["selected_outfit"] for d in batch] == [d["selected_outfit"] for d in singles]
+
+
+def test_step3_context_from_dataclass():
+    context = HybridRecommender._step3_context(_step3_input())
+
+    assert context["user_profile"]["personal_color"] == "Summer Mute"
+    assert context["weather"] == {"summary": "Sunny, 28°C", "temperature": 28.0, "temperature_c": 28.0}
+
+
+def test_step3_dict_with_user_style_profile(recommender):
+    step3_input = _step3_input()
+    as_dict = {
+        "user_query": step3_input.user_query,
+        "weather": step3_input.weather,
+        "occasion": step3_input.occasion,
+        "user_profile": step3_input.user_profile,
+        "constraints": {},
+    }
+
+    assert HybridRecommender._step3_context(as_dict) == HybridRecommender._step3_context(step3_input)
+    assert (recommender.recommend_outfit(as_dict)["selected_outfit"]
+            == recommender.recommend_outfit(step3_input)["selected_outfit"])
+
+
+def test_step3_input_missing_fields():
+    with pytest.raises(ValueError, match="user_profile"):
+        HybridRecommender._step3_context({"user_query": "x", "weather": "Sunny", "occasion": "Date"})
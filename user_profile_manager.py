@@ -9,6 +9,8 @@ import json
 from datetime import datetime
 from typing import Dict, Optional
 
+from json_utils import load_json_cached
+
 
 class UserProfileManager:
     """
@@ -45,8 +47,8 @@ class UserProfileManager:
             return None
         
         try:
-            with open(self.profile_path, 'r', encoding='utf-8') as f:
-                self.profile = json.load(f)
+            # Shallow copy: the cached parse is shared, update_profile mutates self.profile
+            self.profile = dict(load_json_cached(self.profile_path))
             print(f"✓ 已載入使用者資料: {self.profile.get('name', 'User')}")
             return self.profile
         except Exception as e: